@@ -0,0 +1,87 @@
+import statistics
+import sys
+import time
+
+import ps_database
+import workflow_ps
+
+# Perguntas usadas para comparar as topologias do grafo
+questions = [
+    "How many movies were released in 2020 in netflix?",
+    "What are the 3 video game platforms more sold in the history?",
+    "Total sales by product line in the supermarket",
+    "Number of movies and tv shows released per year in netflix",
+]
+
+
+def sample_explain_seconds(query):
+    """
+    Mede o tempo de um EXPLAIN do SQL validado, fora do caminho da pergunta.
+
+    Alimenta a estimativa que o modo "execute" do workflow soma ao tempo economizado sem o EXPLAIN
+    prévio; no workflow o EXPLAIN só roda quando o guard está ligado ou no modo "plan_first".
+    """
+    with ps_database.connection(workflow_ps.db_config) as conn:
+        explain_start = time.perf_counter()
+        ps_database.explain_query(conn, query)
+        workflow_ps.update_explain_seconds_estimate(time.perf_counter() - explain_start)
+
+
+def time_sql_result_to_chart(app, question):
+    """
+    Roda uma pergunta e mede o tempo entre o SQL validado e a visualização validada.
+
+    Returns:
+        Segundos entre os dois eventos, ou None se o SQL ou a visualização não passaram.
+    """
+    sql_done_at = None
+    chart_done_at = None
+    for update in app.stream(workflow_ps.build_initial_state(question), stream_mode="updates"):
+        now = time.perf_counter()
+        for node_name, state in update.items():
+            if node_name == "agent_sql_validator_node" and state["result_debug_sql"] == "Pass":
+                sql_done_at = now
+                query = state["query"]
+            if (node_name == "agent_python_code_data_visualization_validator_node"
+                    and state["result_debug_python_code_data_visualization"] == "Pass"):
+                chart_done_at = now
+    if sql_done_at is None or chart_done_at is None:
+        return None
+    sample_explain_seconds(query)
+    return chart_done_at - sql_done_at
+
+
+def run_benchmark(questions, rounds=1):
+    # Sem cache de LLM, para que as duas topologias façam as mesmas chamadas de verdade
+    workflow_ps.llm.cache = False
+    # As topologias são comparadas sem o seletor heurístico, que dispensaria o LLM nos resultados triviais
+    apps = {
+        "default": workflow_ps.build_workflow(heuristic_visualization=False),
+        "fast_path": workflow_ps.build_workflow(fast_path=True, heuristic_visualization=False),
+        "heuristic": workflow_ps.app,
+    }
+    timings = {name: [] for name in apps}
+    for _ in range(rounds):
+        for question in questions:
+            for name, app in apps.items():
+                seconds = time_sql_result_to_chart(app, question)
+                if seconds is not None:
+                    timings[name].append(seconds)
+
+    print("\nTempo do resultado do SQL até o gráfico:")
+    for name, values in timings.items():
+        if values:
+            print(f"  {name:<10} mediana {statistics.median(values):.2f}s, média {statistics.mean(values):.2f}s "
+                  f"({len(values)} execuções)")
+    if timings["default"] and timings["fast_path"]:
+        saved = statistics.median(timings["default"]) - statistics.median(timings["fast_path"])
+        print(f"  Economia do fast path: {saved:.2f}s por pergunta (mediana)")
+    if workflow_ps.explain_seconds_estimate is not None:
+        print(f"  EXPLAIN evitado pelo modo execute: ~{workflow_ps.explain_seconds_estimate * 1000:.0f} ms "
+              f"por pergunta")
+    return timings
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    run_benchmark(questions, rounds=rounds)
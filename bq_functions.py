@@ -1,25 +1,213 @@
-from google.api_core.exceptions import NotFound
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.client_options import ClientOptions
+from google.api_core.exceptions import BadRequest, GoogleAPIError, NotFound
+from google.auth.credentials import AnonymousCredentials
 from google.cloud import bigquery
+import db_dtypes
 import pandas as pd
+import pyarrow as pa
+import csv
 import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import utils
 
-def get_table_schema(client, project_id, dataset_id, table_id):
-    """Generates schema string in the specified format."""
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # without the Storage Read API every result is downloaded through REST
+    bigquery_storage = None
+
+# Seconds a cached table schema is trusted before it is revalidated against the table's etag/modified time
+schema_cache_ttl = float(os.getenv("BQ_SCHEMA_CACHE_TTL", 600))
+# Threads used to resolve the schemas of the retrieved tables concurrently
+schema_fetch_max_workers = int(os.getenv("BQ_SCHEMA_FETCH_MAX_WORKERS", 8))
+
+# Rendered schema of each table, with the etag/modified time it was rendered from
+table_schema_cache = utils.TTLCache(maxsize=1024, ttl=None)
+
+_clients = {}
+_storage_client = None
+_clients_lock = threading.Lock()
+
+
+def get_client(project_id=None):
+    """
+    Return the process-wide BigQuery client for project_id, creating it on first use.
+
+    When BIGQUERY_EMULATOR_HOST is set (e.g. http://localhost:9050) the client talks to that
+    emulator with anonymous credentials instead of the BigQuery API.
+    """
+    with _clients_lock:
+        client = _clients.get(project_id)
+        if client is None:
+            emulator_host = os.getenv("BIGQUERY_EMULATOR_HOST")
+            if emulator_host:
+                client = bigquery.Client(project=project_id, credentials=AnonymousCredentials(),
+                                         client_options=ClientOptions(api_endpoint=emulator_host))
+            else:
+                client = bigquery.Client(project=project_id)
+            _clients[project_id] = client
+        return client
+
+
+def get_storage_client():
+    """
+    Return the process-wide BigQuery Storage Read client, or None when the Storage Read API is not
+    available (package missing or BIGQUERY_EMULATOR_HOST set).
+    """
+    global _storage_client
+    if bigquery_storage is None or os.getenv("BIGQUERY_EMULATOR_HOST"):
+        return None
+    with _clients_lock:
+        if _storage_client is None:
+            _storage_client = bigquery_storage.BigQueryReadClient()
+        return _storage_client
+
+
+def set_client(client, project_id=None):
+    """Register an already built client (e.g. a mock) as the process-wide client for project_id."""
+    with _clients_lock:
+        _clients[project_id] = client
+
+
+def get_table_schema(client, project_id, dataset_id, table_id, max_age=None):
+    """
+    Generates schema string in the specified format.
+
+    The rendered schema is cached per table. Within max_age seconds (default schema_cache_ttl) it is
+    returned without calling the API; after that the table is fetched again and the schema is only
+    rebuilt if its etag or modified time changed.
+    """
     table_ref = f"{project_id}.{dataset_id}.{table_id}"
-    
+    max_age = schema_cache_ttl if max_age is None else max_age
+
+    cached = table_schema_cache.get(table_ref)
+    if cached is not None and time.monotonic() - cached["checked_at"] < max_age:
+        return cached["schema"]
+
     try:
         table = client.get_table(table_ref)
+    except NotFound:
+        print(f"Table {table_ref} not found")
+        table_schema_cache.pop(table_ref)
+        return None
+
+    version = (table.etag, table.modified)
+    if cached is not None and cached["version"] == version:
+        schema = cached["schema"]
+    else:
         schema_lines = [table_ref]  # Start with table reference
-        
+
         # Process each field recursively
         for field in table.schema:
             schema_lines.extend(field_to_string(field))
-            
-        return '\n'.join(schema_lines)
-        
-    except NotFound:
-        print(f"Table {table_ref} not found")
-        return None
+
+        schema = '\n'.join(schema_lines)
+
+    table_schema_cache.set(table_ref, {"version": version, "schema": schema, "checked_at": time.monotonic()})
+    return schema
+
+
+def get_table_schemas(client, tables, max_workers=None):
+    """
+    Resolve the schema strings of several tables, fetching the ones not in cache concurrently.
+
+    Args:
+        client: BigQuery client (or any object with a compatible get_table).
+        tables: Iterable of (project_id, dataset_id, table_id) tuples.
+        max_workers: Maximum concurrent get_table calls (default schema_fetch_max_workers).
+
+    Returns:
+        List with the schema string of each table (None for tables not found), in the input order.
+    """
+    tables = list(tables)
+    if len(tables) <= 1:
+        return [get_table_schema(client, *table) for table in tables]
+
+    max_workers = min(max_workers or schema_fetch_max_workers, len(tables))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda table: get_table_schema(client, *table), tables))
+
+# Arrow -> pandas conversion for the types pandas has no native zero-copy dtype for (same as to_dataframe)
+arrow_types_mapper = {
+    pa.date32(): db_dtypes.DateDtype(),
+    pa.time64("us"): db_dtypes.TimeDtype(),
+}.get
+
+
+def fetch_dataframe(query_job, max_rows=100_000, max_bytes=256 * 1024 * 1024, storage_read_min_rows=20_000,
+                    bqstorage_client=None):
+    """
+    Download the result of a query job as Arrow record batches and build a capped DataFrame.
+
+    Results with at least storage_read_min_rows rows are read in parallel streams through the
+    Storage Read API (when bqstorage_client is given); smaller ones come from the REST tabledata
+    pages, which for small results are already in the query response. Downloading stops at
+    max_rows rows or max_bytes of Arrow data, and the batches are converted to pandas without
+    consolidating them into a single copy.
+
+    Args:
+        query_job: Started bigquery.QueryJob.
+        max_rows: Maximum number of rows kept.
+        max_bytes: Approximate maximum size in bytes of the Arrow data kept.
+        storage_read_min_rows: Minimum result size, in rows, that goes through the Storage Read API.
+        bqstorage_client: BigQuery Storage Read client, see get_storage_client.
+
+    Returns:
+        Tuple (DataFrame, truncated) where truncated is True when a cap was hit.
+    """
+    rows = query_job.result()
+    use_storage = (bqstorage_client is not None and rows.total_rows is not None
+                   and rows.total_rows >= storage_read_min_rows)
+
+    batches = []
+    total_rows = 0
+    total_bytes = 0
+    truncated = False
+    iterator = rows.to_arrow_iterable(bqstorage_client=bqstorage_client if use_storage else None)
+    try:
+        for batch in iterator:
+            if total_rows + batch.num_rows > max_rows:
+                batch = batch.slice(0, max_rows - total_rows)
+                truncated = True
+            if batch.num_rows and total_bytes + batch.nbytes > max_bytes:
+                # Keeps the rows of the batch that still fit, assuming rows of similar size
+                row_bytes = batch.nbytes / batch.num_rows
+                batch = batch.slice(0, max(int((max_bytes - total_bytes) / row_bytes), 0))
+                truncated = True
+            batches.append(batch)
+            total_rows += batch.num_rows
+            total_bytes += batch.nbytes
+            if truncated:
+                break
+    finally:
+        # Stops the Storage Read download threads when the caps were hit
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+    if truncated and rows.total_rows is not None and total_rows >= rows.total_rows:
+        truncated = False
+    if not batches:
+        return query_job.result().to_dataframe(), False
+
+    table = pa.Table.from_batches(batches)
+    del batches
+    print(f"fetched {total_rows} rows ({total_bytes / (1024 * 1024):.1f} MB) "
+          f"through {'Storage Read API' if use_storage else 'REST'}")
+    return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=arrow_types_mapper), truncated
+
+
+def describe_query_error(error):
+    """Prefix a query error with "Planning error" or "Execution error" for the SQL fixer prompt."""
+    reasons = [err.get("reason") for err in (getattr(error, "errors", None) or []) if isinstance(err, dict)]
+    # invalidQuery/notFound are raised while parsing and planning, before any data is read
+    if "invalidQuery" in reasons or "notFound" in reasons:
+        return f"Planning error: {error}"
+    return f"Execution error: {error}"
 
 def field_to_string(field, parent=""):
     """Recursively converts fields to formatted strings with nested handling."""
@@ -139,11 +327,149 @@ def convert_schema_json_to_bq_schemafield(schema_json):
     return schema
 
 
+# Arrow type used for each BigQuery type when converting CSV files locally
+bq_to_arrow_types = {
+    "STRING": pa.string(),
+    "BYTES": pa.binary(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BIGNUMERIC": pa.decimal256(76, 38),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "DATETIME": pa.timestamp("us"),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "TIME": pa.time64("us"),
+}
+
+
+def bq_schema_to_arrow_schema(schema):
+    """Convert a list of bigquery.SchemaField (see convert_schema_json_to_bq_schemafield) to an Arrow schema."""
+    fields = []
+    for field in schema:
+        if field.field_type not in bq_to_arrow_types:
+            raise ValueError(f"Column {field.name} has type {field.field_type}, which cannot be read from a CSV file")
+        fields.append(pa.field(field.name, bq_to_arrow_types[field.field_type], nullable=field.mode != "REQUIRED"))
+    return pa.schema(fields)
+
+
+def convert_csv_for_bigquery(csv_path, arrow_schema, output_dir, file_format="parquet", chunk_rows=2_000_000,
+                             block_size=16 * 1024 * 1024):
+    """
+    Stream a CSV file through pyarrow into compressed chunk files ready to load into BigQuery.
+
+    The CSV is read block by block (never fully in memory) with the columns typed by arrow_schema,
+    matched by position like a BigQuery CSV load with skip_leading_rows=1, and written to a new
+    file every chunk_rows rows.
+
+    Args:
+        csv_path: Path to CSV file.
+        arrow_schema: Arrow schema of the table, see bq_schema_to_arrow_schema.
+        output_dir: Directory where the chunk files are written.
+        file_format: "parquet" (snappy-compressed, columnar) or "gzip" (gzip-compressed CSV).
+        chunk_rows: Maximum number of rows per chunk file.
+        block_size: Bytes of CSV parsed at a time.
+
+    Returns:
+        List of (chunk_path, rows) tuples, in file order.
+    """
+    from pyarrow import csv as pa_csv
+    from pyarrow import parquet as pq
+
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), [])
+    # Columns are matched by header name when the header only has schema columns (schema columns
+    # missing from the file are loaded as NULL); otherwise by position, like a CSV load job
+    column_names = header if header and set(header) <= set(arrow_schema.names) else arrow_schema.names
+
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(column_names=column_names, skip_rows=1, block_size=block_size),
+        parse_options=pa_csv.ParseOptions(delimiter=',', quote_char='"', newlines_in_values=True),
+        # Empty fields are NULL, as in the BigQuery CSV loader
+        convert_options=pa_csv.ConvertOptions(column_types=arrow_schema, null_values=[""],
+                                              strings_can_be_null=True, quoted_strings_can_be_null=False),
+    )
+
+    chunks = []
+    writer = None
+    stream = None
+    chunk_row_count = 0
+
+    def close_chunk():
+        writer.close()
+        if stream is not None:
+            stream.close()
+        chunks.append((chunk_path, chunk_row_count))
+
+    for batch in reader:
+        if batch.schema.names != arrow_schema.names:
+            batch = pa.RecordBatch.from_arrays(
+                [batch.column(field.name) if field.name in column_names else pa.nulls(batch.num_rows, field.type)
+                 for field in arrow_schema],
+                schema=arrow_schema)
+        offset = 0
+        while offset < batch.num_rows:
+            if writer is None:
+                chunk_path = os.path.join(output_dir, f"chunk_{len(chunks):05d}.{'parquet' if file_format == 'parquet' else 'csv.gz'}")
+                if file_format == "parquet":
+                    writer = pq.ParquetWriter(chunk_path, arrow_schema, compression="snappy")
+                else:
+                    stream = pa.CompressedOutputStream(chunk_path, "gzip")
+                    writer = pa_csv.CSVWriter(stream, arrow_schema)
+                chunk_row_count = 0
+            rows = min(batch.num_rows - offset, chunk_rows - chunk_row_count)
+            writer.write_batch(batch.slice(offset, rows))
+            offset += rows
+            chunk_row_count += rows
+            if chunk_row_count >= chunk_rows:
+                close_chunk()
+                writer = None
+    if writer is not None:
+        close_chunk()
+    return chunks
+
+
+def load_file_with_retry(client, path, table_ref, job_config, max_retries=3):
+    """
+    Load one file into a table, retrying the whole load job on transient errors with exponential backoff.
+
+    Files above 5 MB are already sent through a resumable upload, which resumes interrupted uploads
+    on its own; the retries here cover jobs that fail after the upload.
+
+    Returns:
+        Number of rows loaded by the job.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with open(path, 'rb') as source_file:
+                job = client.load_table_from_file(source_file, table_ref, job_config=job_config,
+                                                  num_retries=max_retries)
+            job.result()  # Wait for job completion
+            return job.output_rows
+        except (GoogleAPIError, ConnectionError, TimeoutError) as e:
+            if attempt == max_retries or isinstance(e, BadRequest):
+                raise
+            wait_seconds = 2 ** attempt
+            print(f"Error loading {os.path.basename(path)} (attempt {attempt + 1}), retrying in {wait_seconds}s: {e}")
+            time.sleep(wait_seconds)
+
+
 def csv_to_bigquery(project_id, dataset_id, table_id, csv_path, schema_path, 
-                    write_disposition='WRITE_TRUNCATE', autodetect=False):
+                    write_disposition='WRITE_TRUNCATE', autodetect=False, file_format='parquet',
+                    chunk_rows=2_000_000, max_retries=3):
     """
     Upload CSV data to BigQuery with schema validation
     
+    With file_format "parquet" or "gzip" the CSV is first converted locally, in a streaming pass,
+    into compressed chunk files of chunk_rows rows (see convert_csv_for_bigquery). Each chunk is
+    its own load job, retried on failure, so a failed chunk does not restart the whole upload.
+    When there is more than one chunk they are loaded into a staging table that is then copied to
+    the destination with write_disposition, so readers never see a partially loaded table.
+
     Args:
         project_id: GCP project ID
         dataset_id: BigQuery dataset ID
@@ -152,9 +478,15 @@ def csv_to_bigquery(project_id, dataset_id, table_id, csv_path, schema_path,
         schema_path: Path to JSON schema file
         write_disposition: WRITE_APPEND, WRITE_TRUNCATE, or WRITE_EMPTY
         autodetect: Whether to use auto-detection (overrides schema)
+        file_format: "parquet", "gzip" or "csv" (uploads the raw file in a single job, as before)
+        chunk_rows: Maximum number of rows per chunk file
+        max_retries: Retries of each load job
+
+    Returns:
+        Number of rows loaded.
     """
-    # Initialize BigQuery client
-    client = bigquery.Client(project=project_id)
+    start_time = time.perf_counter()
+    client = get_client(project_id)
 
     # Load schema from JSON file
     with open(schema_path, 'r') as f:
@@ -163,41 +495,71 @@ def csv_to_bigquery(project_id, dataset_id, table_id, csv_path, schema_path,
     # Convert JSON schema to BigQuery SchemaField objects
     schema = convert_schema_json_to_bq_schemafield(schema_json)
 
-    # Configure load job
-    job_config = bigquery.LoadJobConfig(
-        schema=schema,
-        skip_leading_rows=1,
-        source_format=bigquery.SourceFormat.CSV,
-        write_disposition=write_disposition,
-        autodetect=autodetect,
-        field_delimiter=',',
-        quote_character='"',
-        allow_quoted_newlines=True,
-        encoding='UTF-8'
-    )
-
     # Create table reference
     table_ref = client.dataset(dataset_id).table(table_id)
+    raw_bytes = os.path.getsize(csv_path)
 
-    # Run load job
-    with open(csv_path, 'rb') as csv_file:
-        job = client.load_table_from_file(
-            csv_file,
-            table_ref,
-            job_config=job_config
+    if file_format == "csv" or autodetect:
+        # Configure load job
+        job_config = bigquery.LoadJobConfig(
+            schema=schema,
+            skip_leading_rows=1,
+            source_format=bigquery.SourceFormat.CSV,
+            write_disposition=write_disposition,
+            autodetect=autodetect,
+            field_delimiter=',',
+            quote_character='"',
+            allow_quoted_newlines=True,
+            encoding='UTF-8'
         )
-
         try:
-            job.result()  # Wait for job completion
-            print(f"Loaded {job.output_rows} rows to {dataset_id}.{table_id}")
+            rows = load_file_with_retry(client, csv_path, table_ref, job_config, max_retries)
         except Exception as e:
             print(f"Error loading CSV: {e}")
             raise
+        print(f"Loaded {rows} rows to {dataset_id}.{table_id}: {raw_bytes / 1024 / 1024:.2f} MB uploaded "
+              f"in {time.perf_counter() - start_time:.1f}s")
+        return rows
 
-    # Verify the loaded table
-    table = client.get_table(table_ref)
-    print(f"Table schema:\n{table.schema}")
-    print(f"Table description: {table.description}")
-    return table
+    with tempfile.TemporaryDirectory() as output_dir:
+        chunks = convert_csv_for_bigquery(csv_path, bq_schema_to_arrow_schema(schema), output_dir,
+                                          file_format=file_format, chunk_rows=chunk_rows)
+        compressed_bytes = sum(os.path.getsize(path) for path, _ in chunks)
+        convert_seconds = time.perf_counter() - start_time
+
+        if file_format == "parquet":
+            job_config = bigquery.LoadJobConfig(schema=schema, source_format=bigquery.SourceFormat.PARQUET)
+        else:
+            job_config = bigquery.LoadJobConfig(schema=schema, skip_leading_rows=1,
+                                                source_format=bigquery.SourceFormat.CSV,
+                                                allow_quoted_newlines=True, encoding='UTF-8')
+
+        # Um único arquivo vai direto para a tabela; vários passam por uma tabela de staging
+        if len(chunks) <= 1:
+            load_ref = table_ref
+        else:
+            load_ref = client.dataset(dataset_id).table(f"{table_id}_staging_{uuid.uuid4().hex[:8]}")
+
+        rows = 0
+        try:
+            for i, (path, _) in enumerate(chunks):
+                job_config.write_disposition = (write_disposition if load_ref is table_ref
+                                                else 'WRITE_TRUNCATE' if i == 0 else 'WRITE_APPEND')
+                rows += load_file_with_retry(client, path, load_ref, job_config, max_retries)
+                print(f"Loaded chunk {i + 1}/{len(chunks)} of {dataset_id}.{table_id}")
+
+            if load_ref is not table_ref:
+                copy_config = bigquery.CopyJobConfig(write_disposition=write_disposition)
+                client.copy_table(load_ref, table_ref, job_config=copy_config).result()
+        except Exception as e:
+            print(f"Error loading CSV: {e}")
+            raise
+        finally:
+            if load_ref is not table_ref:
+                client.delete_table(load_ref, not_found_ok=True)
 
-if __name__ == "__main__":
\ No newline at end of file
+    elapsed = time.perf_counter() - start_time
+    print(f"Loaded {rows} rows to {dataset_id}.{table_id} as {file_format}: "
+          f"{raw_bytes / 1024 / 1024:.2f} MB raw, {compressed_bytes / 1024 / 1024:.2f} MB uploaded "
+          f"in {len(chunks)} chunk(s), {elapsed:.1f}s ({convert_seconds:.1f}s converting)")
+    return rows
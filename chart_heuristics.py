@@ -0,0 +1,73 @@
+import pandas as pd
+
+# Máximo de categorias para um gráfico de barras automático
+max_bar_categories = 30
+
+
+def _is_number(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_category(series):
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+            or isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series))
+
+
+def _is_time(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    # Inteiros que representam anos (ex.: release_year) também formam uma série temporal
+    name = str(series.name).lower()
+    return (pd.api.types.is_integer_dtype(series) and ("year" in name or "ano" in name)
+            and series.dropna().between(1800, 2200).all())
+
+
+def select_visualization_code(df: pd.DataFrame, question: str = "") -> str | None:
+    """
+    Pick a visualization for trivially shaped results without calling the LLM.
+
+    The returned code defines the same variables the LLM-generated code does (fig, df_viz or
+    string_viz_result), so it goes through the same validator and is rendered by streamlit_ps.py.
+
+    Rules:
+        - no rows: string_viz_result saying there is no data
+        - a single value: string_viz_result "<column>: <value>"
+        - a single row with several columns: df_viz table
+        - date (or year) + number: line chart
+        - category + number (not a year) with at most max_bar_categories distinct categories: bar chart
+
+    Args:
+        df: Result of the SQL query.
+        question: User question, used as the chart title.
+
+    Returns:
+        Python code, or None when no rule matches and the LLM should decide.
+    """
+    if df.empty:
+        return 'string_viz_result = "The query returned no data."'
+
+    if df.shape == (1, 1):
+        return f'string_viz_result = {str(df.columns[0])!r} + ": " + str(df.iloc[0, 0])'
+
+    if len(df) == 1:
+        return "df_viz = df"
+
+    if df.shape[1] != 2 or df.columns.duplicated().any():
+        return None
+
+    first, second = df.columns
+    title = question.strip()
+    for x, y in ((first, second), (second, first)):
+        if _is_time(df[x]) and _is_number(df[y]) and not _is_time(df[y]):
+            return (
+                "import plotly.express as px\n"
+                f"fig = px.line(df.sort_values({x!r}), x={x!r}, y={y!r}, title={title!r}, markers=True)"
+            )
+    for x, y in ((first, second), (second, first)):
+        if (_is_category(df[x]) and _is_number(df[y]) and not _is_time(df[y]) and df[x].is_unique
+                and df[x].nunique() <= max_bar_categories):
+            return (
+                "import plotly.express as px\n"
+                f"fig = px.bar(df, x={x!r}, y={y!r}, title={title!r})"
+            )
+    return None
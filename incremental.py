@@ -0,0 +1,523 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import Counter
+
+import psycopg2
+
+import ps_functions
+
+# Arquivo com o valor máximo da coluna de watermark já carregado de cada tabela
+default_watermark_path = os.getenv("WATERMARK_PATH", ".watermarks.json")
+# Diretório com o hash de cada linha já carregada das tabelas sem coluna de watermark (um arquivo por tabela)
+default_row_hashes_dir = os.getenv("ROW_HASHES_DIR", ".row_hashes")
+# Separa os valores de uma chave composta (e os campos de uma linha no hash)
+key_separator = "\x1f"
+
+_watermark_lock = threading.Lock()
+
+
+def load_schema(schema_path):
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_key_columns(schema_json):
+    """Return the columns declared with "primary_key": true in schema.json, in schema order."""
+    return [field["name"] for field in schema_json if field.get("primary_key")]
+
+
+def get_watermark_column(schema_json):
+    """Return the column declared with "watermark": true in schema.json, or None."""
+    return next((field["name"] for field in schema_json if field.get("watermark")), None)
+
+
+def read_watermark(watermark_path, watermark_key):
+    with _watermark_lock:
+        if not os.path.exists(watermark_path):
+            return None
+        with open(watermark_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get(watermark_key)
+
+
+def save_watermark(watermark_path, watermark_key, watermark):
+    """Record a watermark, rewriting the file atomically (several tables may load at the same time)."""
+    with _watermark_lock:
+        watermarks = {}
+        if os.path.exists(watermark_path):
+            with open(watermark_path, 'r', encoding='utf-8') as f:
+                watermarks = json.load(f)
+        watermarks[watermark_key] = watermark
+        temporary_path = f"{watermark_path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f, indent=2)
+        os.replace(temporary_path, watermark_path)
+
+
+def row_hashes_path(row_hashes_dir, watermark_key):
+    """Return the file with the row hashes of a table (one JSON file per table in row_hashes_dir)."""
+    return os.path.join(row_hashes_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", watermark_key) + ".json")
+
+
+def read_row_hashes(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_row_hashes(path, row_hashes):
+    """Record the row hashes of a table, rewriting its file atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(row_hashes, f)
+    os.replace(temporary_path, path)
+
+
+def _row_hash(row):
+    return hashlib.blake2b(key_separator.join(row).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _watermark_value(value, field_type):
+    # Colunas numéricas são comparadas como número; datas ISO e textos, como texto
+    if field_type.upper() in ("INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC"):
+        return float(value)
+    return value
+
+
+def extract_delta(csv_path, schema_json, watermark, delta_path, watermark_column, inclusive=False,
+                  row_number_column=None):
+    """
+    Write the rows of a CSV file past the stored watermark to delta_path.
+
+    These are the rows whose watermark_column value is above the stored maximum, or equal to it
+    when inclusive (safe for upserts, and catches rows that arrived with the same value).
+
+    Args:
+        csv_path: Path to CSV file.
+        schema_json: JSON schema of the table.
+        watermark: Watermark stored for the table by the previous load, or None on the first load.
+        delta_path: Path where the delta CSV (with the header) is written.
+        watermark_column: Column used as watermark.
+        inclusive: Whether rows equal to the stored watermark value are included.
+        row_number_column: If given, an extra column with this name and the row number in the file
+            (1 = first data row) is appended, so duplicated keys can keep the last row.
+
+    Returns:
+        Tuple (headers of the CSV file, number of delta rows, new watermark).
+    """
+    field_type = next(field["type"] for field in schema_json if field["name"] == watermark_column)
+    last_value = None
+    if watermark and watermark.get("column") == watermark_column:
+        last_value = _watermark_value(watermark["value"], field_type)
+
+    delta_rows = 0
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file, \
+            open(delta_path, 'w', encoding='utf-8', newline='') as delta_file:
+        reader = csv.reader(csv_file)
+        writer = csv.writer(delta_file)
+        headers = next(reader)
+        writer.writerow(headers + [row_number_column] if row_number_column else headers)
+
+        index = headers.index(watermark_column)
+        max_value = last_value
+        max_raw_value = watermark["value"] if last_value is not None else None
+        for row_number, row in enumerate(reader, start=1):
+            if row[index] == "":
+                continue
+            value = _watermark_value(row[index], field_type)
+            if last_value is not None and (value < last_value or (value == last_value and not inclusive)):
+                continue
+            if max_value is None or value > max_value:
+                max_value, max_raw_value = value, row[index]
+            writer.writerow(row + [row_number] if row_number_column else row)
+            delta_rows += 1
+
+    return headers, delta_rows, {"column": watermark_column, "value": max_raw_value}
+
+
+def extract_changes(csv_path, key_columns, row_hashes, delta_path, deleted_column=None, row_number_column=None):
+    """
+    Write the rows of a CSV file that changed since the previous load to delta_path.
+
+    The file is compared with the row hashes saved by the previous load, so the delta (and the
+    work done on the database) is proportional to the changes, not to the file. With key columns
+    the hashes are kept per key: the delta has the rows whose key is new or whose content changed
+    (the last row of the file for repeated keys) and, when deleted_column is given, one row per
+    key no longer in the file, with only the key columns filled and deleted_column set to true.
+
+    Without key columns the hashes are a count per distinct row: the delta has the rows added to
+    the file, and only the number of removed rows is returned, since without a key the table row
+    to delete cannot be told apart from its identical copies.
+
+    Args:
+        csv_path: Path to CSV file.
+        key_columns: Primary key columns of the table (may be empty).
+        row_hashes: Row hashes saved by the previous load, or None on the first load.
+        delta_path: Path where the delta CSV (with the header) is written.
+        deleted_column: If given, an extra column with this name flags the rows of removed keys.
+        row_number_column: If given, an extra column with this name and the row number in the file
+            (1 = first data row, 0 for removed keys) is appended.
+
+    Returns:
+        Tuple (headers of the CSV file, number of changed rows, number of removed rows, new row hashes).
+    """
+    row_hashes = row_hashes or {}
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        headers = next(reader)
+        key_indexes = [headers.index(column) for column in key_columns]
+        if key_columns:
+            latest = {}
+            for row_number, row in enumerate(reader, start=1):
+                latest[key_separator.join(row[index] for index in key_indexes)] = (_row_hash(row), row_number)
+            new_hashes = {key: row_hash for key, (row_hash, _) in latest.items()}
+            changed = {row_number for key, (row_hash, row_number) in latest.items() if row_hashes.get(key) != row_hash}
+            removed = [key for key in row_hashes if key not in latest]
+        else:
+            counts = Counter(_row_hash(row) for row in reader)
+            new_hashes = dict(counts)
+            added = counts - Counter(row_hashes)
+            removed_rows = sum((Counter(row_hashes) - counts).values())
+
+    changed_rows = 0
+    extra_headers = [column for column in (deleted_column, row_number_column) if column]
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file, \
+            open(delta_path, 'w', encoding='utf-8', newline='') as delta_file:
+        reader = csv.reader(csv_file)
+        writer = csv.writer(delta_file)
+        next(reader)
+        writer.writerow(headers + extra_headers)
+        for row_number, row in enumerate(reader, start=1):
+            if key_columns:
+                if row_number not in changed:
+                    continue
+            else:
+                row_hash = _row_hash(row)
+                if not added[row_hash]:
+                    continue
+                added[row_hash] -= 1
+            extra = (["false"] if deleted_column else []) + ([row_number] if row_number_column else [])
+            writer.writerow(row + extra)
+            changed_rows += 1
+
+        if key_columns:
+            removed_rows = len(removed)
+            for key in removed if deleted_column else []:
+                row = [""] * len(headers)
+                for index, value in zip(key_indexes, key.split(key_separator)):
+                    row[index] = value
+                writer.writerow(row + ["true"] + ([0] if row_number_column else []))
+
+    return headers, changed_rows, removed_rows, new_hashes
+
+
+### PostgreSQL
+
+def ensure_unique_key(cursor, table_name, key_columns):
+    """Create a unique index on the key columns unless the table already has one (required by ON CONFLICT)."""
+    cursor.execute("""
+        SELECT 1
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+          AND i.indisunique
+          AND (SELECT array_agg(a.attname::text ORDER BY a.attname)
+               FROM pg_attribute a
+               WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) = %s;
+    """, (table_name, sorted(key_columns)))
+    if cursor.fetchone() is None:
+        keys = ', '.join(f'"{column}"' for column in key_columns)
+        print(f"Criando índice único em {table_name} ({keys}) para o upsert...")
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_upsert_key" ON {table_name} ({keys});')
+
+
+def generate_upsert_query(table_name, staging_table, headers, key_columns, where=None):
+    """
+    Generate the INSERT ... SELECT that merges a staging table into the target table.
+
+    With key columns, rows whose key already exists are updated (ON CONFLICT DO UPDATE) only when
+    some column differs, and duplicated keys in the staging table are reduced to the last row of
+    the file (ON CONFLICT cannot touch the same row twice). Without key columns the staging rows
+    are appended. where optionally filters the staging rows.
+    """
+    columns = ', '.join(f'"{header}"' for header in headers)
+    where_sql = f" WHERE {where}" if where else ""
+    if not key_columns:
+        return f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table}{where_sql};"
+
+    keys = ', '.join(f'"{column}"' for column in key_columns)
+    values = [header for header in headers if header not in key_columns]
+    if values:
+        updates = ', '.join(f'"{header}" = EXCLUDED."{header}"' for header in values)
+        target_values = ', '.join(f'target."{header}"' for header in values)
+        excluded_values = ', '.join(f'EXCLUDED."{header}"' for header in values)
+        # Linhas iguais às da tabela não são reescritas (nem contadas)
+        conflict_action = (f"DO UPDATE SET {updates} "
+                           f"WHERE ROW({target_values}) IS DISTINCT FROM ROW({excluded_values})")
+    else:
+        conflict_action = "DO NOTHING"
+    return (f"INSERT INTO {table_name} AS target ({columns}) "
+            f"SELECT DISTINCT ON ({keys}) {columns} FROM {staging_table}{where_sql} ORDER BY {keys}, ctid DESC "
+            f"ON CONFLICT ({keys}) {conflict_action};")
+
+
+def generate_delete_keys_query(table_name, staging_table, key_columns, deleted_column):
+    """Generate the DELETE of the target rows whose key is flagged with deleted_column in the staging table."""
+    on = ' AND '.join(f'staging."{column}" = target."{column}"' for column in key_columns)
+    return (f"DELETE FROM {table_name} AS target USING {staging_table} AS staging "
+            f"WHERE staging.\"{deleted_column}\" AND {on};")
+
+
+def load_incremental_postgres(db_config, table_name, csv_path, schema_path, watermark_path=None,
+                              watermark_column=None, row_hashes_dir=None):
+    """
+    Load only the new, changed or removed rows of a CSV file into a PostgreSQL table.
+
+    The first load replaces the table contents. With a watermark column (schema.json
+    "watermark": true or watermark_column), later loads COPY only the rows past the watermark (see
+    extract_delta) into a temporary staging table, merged into the target with INSERT ... ON
+    CONFLICT on the schema.json primary keys, or appended when the schema declares none.
+
+    Without a watermark column the file is compared with the row hashes saved by the previous load
+    (see extract_changes) before anything is sent. For keyed tables only the changed rows and the
+    keys of the removed rows are staged; the removed keys are deleted and the changed rows
+    upserted. Tables without primary keys get the added rows appended, but a row edited or removed
+    from the file cannot be located in the table, so in that case the table is reloaded in full.
+
+    The watermark or row hashes are saved only after the transaction commits.
+
+    Args:
+        db_config: Dictionary with PostgreSQL connection parameters (host, dbname, user, password, port).
+        table_name: PostgreSQL table name.
+        csv_path: Path to CSV file.
+        schema_path: Path to JSON schema file.
+        watermark_path: Path to the watermark file (default WATERMARK_PATH or .watermarks.json).
+        watermark_column: Column used as watermark (default: the one declared in schema.json, if any).
+        row_hashes_dir: Directory of the row hash files (default ROW_HASHES_DIR or .row_hashes).
+
+    Returns:
+        Number of rows inserted, updated or deleted.
+    """
+    watermark_path = watermark_path or default_watermark_path
+    schema_json = load_schema(schema_path)
+    key_columns = get_key_columns(schema_json)
+    watermark_column = watermark_column or get_watermark_column(schema_json)
+    watermark_key = f"postgres:{table_name}"
+    hashes_path = row_hashes_path(row_hashes_dir or default_row_hashes_dir, watermark_key)
+    deleted_column = "_incremental_deleted"
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        delta_path = os.path.join(temporary_dir, "delta.csv")
+        if watermark_column is not None:
+            previous = read_watermark(watermark_path, watermark_key)
+            headers, delta_rows, new_state = extract_delta(csv_path, schema_json, previous, delta_path,
+                                                           watermark_column, inclusive=bool(key_columns))
+            removed_rows = 0
+            print(f"[{table_name}] {delta_rows} linhas depois do watermark em '{csv_path}'.")
+        else:
+            previous = read_row_hashes(hashes_path)
+            headers, delta_rows, removed_rows, new_state = extract_changes(
+                csv_path, key_columns, previous, delta_path,
+                deleted_column=deleted_column if key_columns and previous is not None else None)
+            print(f"[{table_name}] {delta_rows} linhas novas ou alteradas e {removed_rows} removidas em '{csv_path}'.")
+
+        def save_state():
+            if watermark_column is not None:
+                save_watermark(watermark_path, watermark_key, new_state)
+            else:
+                save_row_hashes(hashes_path, new_state)
+
+        if previous is not None and delta_rows == 0 and removed_rows == 0:
+            save_state()
+            return 0
+
+        # Sem chave não há como achar na tabela a linha alterada ou removida: recarrega o arquivo todo
+        full_reload = previous is None or (not key_columns and removed_rows > 0)
+        conn = psycopg2.connect(**db_config)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ps_functions.generate_create_table_query(table_name, schema_json,
+                                                                        primary_key=True))
+                if key_columns:
+                    ensure_unique_key(cursor, table_name, key_columns)
+
+                if full_reload or not key_columns:
+                    if full_reload:
+                        cursor.execute(f"TRUNCATE TABLE {table_name};")
+                    source_path = csv_path if previous is not None and full_reload else delta_path
+                    with open(source_path, 'r', encoding='utf-8', newline='') as source_file:
+                        cursor.copy_expert(ps_functions.generate_copy_query(table_name, headers), source_file)
+                    merged_rows, deleted_rows = cursor.rowcount, 0
+                else:
+                    # Tabela temporária é da sessão: cargas concorrentes da mesma tabela não colidem.
+                    # Sem as restrições NOT NULL da tabela, pois as linhas de chaves removidas só têm a chave
+                    staging_table = f"{table_name}_staging"
+                    cursor.execute(f"CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS "
+                                   f"SELECT * FROM {table_name} WITH NO DATA;")
+                    staging_headers = headers
+                    deleted_rows = 0
+                    if watermark_column is None:
+                        cursor.execute(f'ALTER TABLE {staging_table} ADD COLUMN "{deleted_column}" boolean;')
+                        staging_headers = headers + [deleted_column]
+                    with open(delta_path, 'r', encoding='utf-8', newline='') as delta_file:
+                        cursor.copy_expert(ps_functions.generate_copy_query(staging_table, staging_headers),
+                                           delta_file)
+                    if watermark_column is None:
+                        cursor.execute(generate_delete_keys_query(table_name, staging_table, key_columns,
+                                                                  deleted_column))
+                        deleted_rows = cursor.rowcount
+                    cursor.execute(generate_upsert_query(
+                        table_name, staging_table, headers, key_columns,
+                        where=f'NOT "{deleted_column}"' if watermark_column is None else None))
+                    merged_rows = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    save_state()
+    print(f"[{table_name}] {merged_rows} linhas inseridas/atualizadas, {deleted_rows} removidas.")
+    return merged_rows + deleted_rows
+
+
+### BigQuery
+
+def generate_merge_query(table_ref, staging_ref, columns, key_columns, row_number_column, deleted_column=None):
+    """
+    Generate the BigQuery MERGE of a staging table into the target.
+
+    Duplicated keys in the staging table keep the last row of the file (highest row_number_column),
+    as on PostgreSQL; matched rows are updated only when some column differs. With deleted_column,
+    target rows whose staging row has it set to true are deleted.
+    """
+    keys = ', '.join(f"`{column}`" for column in key_columns)
+    on = ' AND '.join(f"T.`{column}` = S.`{column}`" for column in key_columns)
+    values = [column for column in columns if column not in key_columns]
+    updates = ', '.join(f"`{column}` = S.`{column}`" for column in values)
+    changed = ' OR '.join(f"T.`{column}` IS DISTINCT FROM S.`{column}`" for column in values)
+    insert_columns = ', '.join(f"`{column}`" for column in columns)
+    insert_values = ', '.join(f"S.`{column}`" for column in columns)
+    deleted = f"WHEN MATCHED AND S.`{deleted_column}` THEN DELETE\n" if deleted_column else ""
+    matched = f"WHEN MATCHED AND ({changed}) THEN UPDATE SET {updates}\n" if updates else ""
+    not_deleted = f" AND NOT S.`{deleted_column}`" if deleted_column else ""
+    return (f"MERGE `{table_ref}` T\n"
+            f"USING (SELECT * EXCEPT (`{row_number_column}`) FROM `{staging_ref}` WHERE TRUE "
+            f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY `{row_number_column}` DESC) = 1) S\n"
+            f"ON {on}\n"
+            f"{deleted}"
+            f"{matched}"
+            f"WHEN NOT MATCHED{not_deleted} THEN INSERT ({insert_columns}) VALUES ({insert_values})")
+
+
+def load_incremental_bigquery(project_id, dataset_id, table_id, csv_path, schema_path, watermark_path=None,
+                              watermark_column=None, row_hashes_dir=None):
+    """
+    Load only the new, changed or removed rows of a CSV file into a BigQuery table.
+
+    The first load writes the whole file to the table. Later loads find the delta as in
+    load_incremental_postgres: the rows past the watermark when there is a watermark column, or
+    otherwise the changed rows and removed keys found by comparing the file with the saved row
+    hashes. For keyed tables the delta is uploaded to a staging table with a unique name and
+    MERGEd into the target on the schema.json primary keys (removed keys are deleted by the same
+    MERGE). Without primary keys the new rows are appended with WRITE_APPEND, and a table whose
+    file had rows edited or removed is rewritten in full. The watermark or row hashes are saved
+    only after the load job succeeds.
+
+    Args:
+        project_id: GCP project ID.
+        dataset_id: BigQuery dataset ID.
+        table_id: BigQuery table ID.
+        csv_path: Path to CSV file.
+        schema_path: Path to JSON schema file.
+        watermark_path: Path to the watermark file (default WATERMARK_PATH or .watermarks.json).
+        watermark_column: Column used as watermark (default: the one declared in schema.json, if any).
+        row_hashes_dir: Directory of the row hash files (default ROW_HASHES_DIR or .row_hashes).
+
+    Returns:
+        Number of rows inserted, updated or deleted.
+    """
+    import bq_functions
+
+    watermark_path = watermark_path or default_watermark_path
+    schema_json = load_schema(schema_path)
+    key_columns = get_key_columns(schema_json)
+    watermark_column = watermark_column or get_watermark_column(schema_json)
+    table_ref = f"{project_id}.{dataset_id}.{table_id}"
+    watermark_key = f"bigquery:{table_ref}"
+    hashes_path = row_hashes_path(row_hashes_dir or default_row_hashes_dir, watermark_key)
+    # Número da linha no arquivo, para o MERGE manter a última linha de cada chave repetida
+    row_number_column = "_incremental_row_number"
+    deleted_column = "_incremental_deleted"
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        delta_path = os.path.join(temporary_dir, "delta.csv")
+        if watermark_column is not None:
+            previous = read_watermark(watermark_path, watermark_key)
+            merge = previous is not None and bool(key_columns)
+            _, delta_rows, new_state = extract_delta(csv_path, schema_json, previous, delta_path, watermark_column,
+                                                     inclusive=bool(key_columns),
+                                                     row_number_column=row_number_column if merge else None)
+            removed_rows = 0
+        else:
+            previous = read_row_hashes(hashes_path)
+            merge = previous is not None and bool(key_columns)
+            _, delta_rows, removed_rows, new_state = extract_changes(
+                csv_path, key_columns, previous, delta_path,
+                deleted_column=deleted_column if merge else None,
+                row_number_column=row_number_column if merge else None)
+        print(f"[{table_id}] {delta_rows} linhas novas ou alteradas e {removed_rows} removidas em '{csv_path}'.")
+
+        def save_state():
+            if watermark_column is not None:
+                save_watermark(watermark_path, watermark_key, new_state)
+            else:
+                save_row_hashes(hashes_path, new_state)
+
+        if previous is not None and delta_rows == 0 and removed_rows == 0:
+            save_state()
+            return 0
+
+        if not merge:
+            # A primeira carga substitui a tabela; sem chaves o delta é só acrescentado, a menos que
+            # linhas tenham sido alteradas ou removidas do arquivo (aí a tabela é reescrita)
+            full_reload = previous is None or removed_rows > 0
+            merged_rows = bq_functions.csv_to_bigquery(
+                project_id, dataset_id, table_id,
+                csv_path if previous is not None and full_reload else delta_path, schema_path,
+                write_disposition='WRITE_TRUNCATE' if full_reload else 'WRITE_APPEND')
+        else:
+            # Linhas de chaves removidas só têm a chave preenchida: as demais colunas aceitam nulo no staging
+            staging_schema = [field if field["name"] in key_columns else {**field, "mode": "NULLABLE"}
+                              for field in schema_json]
+            if watermark_column is None:
+                staging_schema.append({"name": deleted_column, "type": "BOOLEAN", "mode": "REQUIRED"})
+            staging_schema.append({"name": row_number_column, "type": "INTEGER", "mode": "REQUIRED"})
+            staging_schema_path = os.path.join(temporary_dir, "staging_schema.json")
+            with open(staging_schema_path, 'w', encoding='utf-8') as f:
+                json.dump(staging_schema, f)
+            # Nome único: cargas concorrentes da mesma tabela não sobrescrevem o staging uma da outra
+            staging_id = f"{table_id}_delta_{uuid.uuid4().hex[:8]}"
+            client = bq_functions.get_client(project_id)
+            try:
+                bq_functions.csv_to_bigquery(project_id, dataset_id, staging_id, delta_path, staging_schema_path,
+                                             write_disposition='WRITE_TRUNCATE')
+                merge_query = generate_merge_query(
+                    table_ref, f"{project_id}.{dataset_id}.{staging_id}", [field["name"] for field in schema_json],
+                    key_columns, row_number_column, deleted_column=deleted_column if watermark_column is None else None)
+                job = client.query(merge_query)
+                job.result()
+                merged_rows = job.num_dml_affected_rows
+            finally:
+                client.delete_table(f"{project_id}.{dataset_id}.{staging_id}", not_found_ok=True)
+
+    save_state()
+    print(f"[{table_id}] {merged_rows} linhas inseridas/atualizadas/removidas.")
+    return merged_rows
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def load_manifest(manifest_path):
+    """
+    Load the list of datasets to ingest.
+
+    Args:
+        manifest_path: Path to a JSON file with a list of entries containing table_name, csv_path and schema_path.
+
+    Returns:
+        List of manifest entries.
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _load_entry(load_table, entry):
+    """Run a single load and collect its timing."""
+    start_time = time.perf_counter()
+    result = {
+        "table_name": entry["table_name"],
+        "bytes": os.path.getsize(entry["csv_path"]) if os.path.exists(entry["csv_path"]) else 0,
+        "rows": None,
+        "status": "failed",
+        "error": "",
+    }
+    try:
+        result["rows"] = load_table(entry)
+        if result["rows"] is not None:
+            result["status"] = "ok"
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start_time
+    return result
+
+
+def run_ingestion(manifest, load_table, max_workers=4):
+    """
+    Load independent datasets concurrently with a bounded worker pool.
+
+    Each worker runs one load at a time, so loaders that open their own connection
+    (csv_to_postgres) or their own load job (csv_to_bigquery) get one per worker.
+
+    Args:
+        manifest: List of entries as returned by load_manifest.
+        load_table: Function called with a manifest entry that loads it and returns the number of rows loaded
+            (None or an exception marks the load as failed).
+        max_workers: Maximum number of tables loaded at the same time.
+
+    Returns:
+        List of per-table results (table_name, status, rows, bytes, seconds, error).
+    """
+    start_time = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_load_entry, load_table, entry) for entry in manifest]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{result['table_name']}] {result['status']} em {result['seconds']:.2f}s "
+                  f"({result['rows']} linhas) {result['error']}".strip())
+    elapsed = time.perf_counter() - start_time
+
+    print_ingestion_summary(results, elapsed)
+    return results
+
+
+def print_ingestion_summary(results, elapsed):
+    """
+    Print per-table timing and the aggregate throughput of an ingestion run.
+
+    Args:
+        results: List of per-table results returned by run_ingestion.
+        elapsed: Wall-clock time of the whole run in seconds.
+    """
+    print("\nResumo da ingestão:")
+    for result in sorted(results, key=lambda r: r["seconds"], reverse=True):
+        megabytes = result["bytes"] / 1024 / 1024
+        print(f"  {result['table_name']:<32} {result['status']:<7} {result['seconds']:>8.2f}s "
+              f"{megabytes:>8.2f} MB {result['rows'] or 0:>10} linhas")
+
+    loaded = [r for r in results if r["status"] == "ok"]
+    total_rows = sum(r["rows"] for r in loaded)
+    total_megabytes = sum(r["bytes"] for r in loaded) / 1024 / 1024
+    serial_seconds = sum(r["seconds"] for r in results)
+    print(f"  Tabelas carregadas: {len(loaded)}/{len(results)}")
+    print(f"  Tempo total: {elapsed:.2f}s (soma sequencial: {serial_seconds:.2f}s)")
+    if elapsed > 0:
+        print(f"  Throughput: {total_rows / elapsed:.0f} linhas/s, {total_megabytes / elapsed:.2f} MB/s")
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+import utils
+
+llm_cache_path = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+llm_cache_memory_maxsize = int(os.getenv("LLM_CACHE_MEMORY_MAXSIZE", 512))
+llm_cache_max_disk_bytes = int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", 100 * 1024 * 1024))
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Two-tier LangChain cache for LLM responses.
+
+    Entries are keyed by a hash of the LLM configuration string (model name, temperature and other
+    invocation parameters) and the rendered prompt. Lookups hit an in-memory LRU first and then a
+    SQLite file, which is trimmed (least recently used first) once it grows beyond max_disk_bytes.
+    Pass it as `cache=` to a chat model to cache every chain built on that model.
+    """
+
+    def __init__(self, database_path=llm_cache_path, memory_maxsize=llm_cache_memory_maxsize,
+                 max_disk_bytes=llm_cache_max_disk_bytes):
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = utils.TTLCache(maxsize=memory_maxsize, ttl=None)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        generations = self._memory.get(key)
+        if generations is not None:
+            self.memory_hits += 1
+            return generations
+
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.disk_hits += 1
+
+        generations = loads(row[0])
+        self._memory.set(key, generations)
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        self._memory.set(key, return_val)
+        value = dumps(return_val)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total_size <= self.max_disk_bytes:
+            return
+        expired_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+            if total_size <= self.max_disk_bytes:
+                break
+            expired_keys.append((key,))
+            total_size -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", expired_keys)
+
+    def clear(self, **kwargs):
+        self._memory.clear()
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,329 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+from psycopg2 import pool
+
+# Tamanho do pool e intervalos, configuráveis por variáveis de ambiente
+pool_min_connections = int(os.getenv("PG_POOL_MIN_CONNECTIONS", 1))
+pool_max_connections = int(os.getenv("PG_POOL_MAX_CONNECTIONS", 10))
+pool_checkout_timeout = float(os.getenv("PG_POOL_CHECKOUT_TIMEOUT", 30))
+pool_health_check_interval = float(os.getenv("PG_POOL_HEALTH_CHECK_INTERVAL", 30))
+# statement_timeout de cada sessão do pool (0 desativa)
+pg_statement_timeout_ms = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", 30_000))
+
+
+class PostgresPool:
+    """
+    Thread-safe PostgreSQL connection pool shared by the whole process.
+
+    Checkouts block (up to checkout_timeout seconds) when every connection is in use instead of
+    failing, and connections idle for longer than health_check_interval are pinged before being
+    handed out, so a connection dropped by the server is replaced transparently.
+    """
+
+    def __init__(self, db_config, minconn=pool_min_connections, maxconn=pool_max_connections,
+                 checkout_timeout=pool_checkout_timeout, health_check_interval=pool_health_check_interval,
+                 statement_timeout_ms=pg_statement_timeout_ms):
+        connect_kwargs = dict(db_config)
+        if statement_timeout_ms:
+            # Definido na abertura da sessão, sem round trip extra por consulta
+            options = connect_kwargs.get("options", "")
+            connect_kwargs["options"] = f"{options} -c statement_timeout={int(statement_timeout_ms)}".strip()
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._available = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+    def getconn(self):
+        if not self._available.acquire(timeout=self.checkout_timeout):
+            raise pool.PoolError(f"Nenhuma conexão livre no pool após {self.checkout_timeout}s")
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed:
+                # Encerra qualquer transação aberta para devolver a conexão limpa ao pool
+                conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+            else:
+                self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        except psycopg2.Error:
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._available.release()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.extensions.QueryCanceledError:
+            # statement_timeout cancela só a consulta: a sessão continua válida e volta ao pool após o rollback
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config, minconn=None, maxconn=None, statement_timeout_ms=None):
+    """
+    Return the process-wide pool for db_config, creating it on first use.
+
+    Args:
+        db_config: Dictionary with PostgreSQL connection parameters (host, dbname, user, password, port).
+        minconn: Minimum number of connections kept open (only used when the pool is created).
+        maxconn: Maximum number of connections (only used when the pool is created).
+        statement_timeout_ms: statement_timeout of every pooled session (only used when the pool is created).
+
+    Returns:
+        PostgresPool instance.
+    """
+    key = tuple(sorted(db_config.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = PostgresPool(db_config,
+                                       minconn=minconn or pool_min_connections,
+                                       maxconn=maxconn or pool_max_connections,
+                                       statement_timeout_ms=(pg_statement_timeout_ms if statement_timeout_ms is None
+                                                             else statement_timeout_ms))
+        return _pools[key]
+
+
+def connection(db_config):
+    """
+    Check out a pooled connection for the duration of a `with` block.
+
+    The connection is rolled back and returned to the pool on exit; call conn.commit() inside the
+    block to keep writes.
+
+    Args:
+        db_config: Dictionary with PostgreSQL connection parameters.
+    """
+    return get_pool(db_config).connection()
+
+
+def close_pools():
+    """Close every pooled connection (e.g. on shutdown)."""
+    with _pools_lock:
+        for conn_pool in _pools.values():
+            conn_pool.closeall()
+        _pools.clear()
+
+
+# OIDs de tipos do PostgreSQL convertidos direto para dtypes do pandas
+pg_type_dtypes = {
+    16: "boolean",    # bool
+    20: "Int64",      # int8
+    21: "Int64",      # int2
+    23: "Int64",      # int4
+    700: "float64",   # float4
+    701: "float64",   # float8
+    1700: "float64",  # numeric
+}
+pg_datetime_types = {1082, 1114}  # date, timestamp
+pg_datetime_tz_types = {1184}     # timestamptz
+
+
+def _to_series(values, type_code):
+    """Build one typed column from the fetched values of a result column."""
+    try:
+        if type_code in pg_type_dtypes:
+            return pd.Series(values, dtype=pg_type_dtypes[type_code])
+        if type_code in pg_datetime_types or type_code in pg_datetime_tz_types:
+            return pd.Series(pd.to_datetime(values, utc=type_code in pg_datetime_tz_types))
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return pd.Series(values, dtype=object)
+
+
+def fetch_dataframe(conn, query, max_rows=100_000, max_bytes=256 * 1024 * 1024, batch_size=5_000):
+    """
+    Run a query through a server-side cursor and build a capped, typed DataFrame.
+
+    Rows are fetched in batches of batch_size and appended column by column, so the full result
+    is never held as a list of tuples. Fetching stops at max_rows rows or once the fetched values
+    reach roughly max_bytes.
+
+    Args:
+        conn: Open psycopg2 connection (not in autocommit mode).
+        query: SELECT query to run.
+        max_rows: Maximum number of rows kept.
+        max_bytes: Approximate maximum size in bytes of the fetched values.
+        batch_size: Number of rows fetched per round trip.
+
+    Returns:
+        Tuple (DataFrame, truncated) where truncated is True when a cap was hit.
+    """
+    truncated = False
+    total_rows = 0
+    total_bytes = 0
+    with conn.cursor(name=f"fetch_{uuid.uuid4().hex}") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query)
+        columns = None
+        while True:
+            remaining = max_rows - total_rows
+            # Busca uma linha a mais que o limite para saber se o resultado foi cortado
+            rows = cursor.fetchmany(min(batch_size, remaining + 1))
+            if columns is None:
+                description = cursor.description
+                columns = [[] for _ in description]
+            if not rows:
+                break
+            if len(rows) > remaining:
+                rows = rows[:remaining]
+                truncated = True
+
+            kept = 0
+            for row in rows:
+                row_bytes = sum(sys.getsizeof(value) for value in row)
+                if total_bytes + row_bytes > max_bytes:
+                    truncated = True
+                    break
+                total_bytes += row_bytes
+                kept += 1
+            rows = rows[:kept]
+
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+            total_rows += len(rows)
+            if truncated:
+                break
+
+    df = pd.DataFrame({i: _to_series(values, desc.type_code)
+                       for i, (desc, values) in enumerate(zip(description, columns))})
+    # Atribuído depois para preservar nomes de colunas repetidos (ex.: dois "count")
+    df.columns = [desc.name for desc in description]
+    return df, truncated
+
+
+def describe_query_error(error):
+    """
+    Label a query error as a planning or an execution error for the SQL fixer prompt.
+
+    Planning errors (syntax, unknown table/column, type mismatch, unsupported feature) are detected
+    by the parser/planner before any row is read; every other error happened while executing.
+
+    Args:
+        error: Exception raised while running the query.
+
+    Returns:
+        Error message prefixed with "Planning error" or "Execution error".
+    """
+    if isinstance(error, QueryGuardError):
+        return str(error)
+    pgcode = getattr(error, "pgcode", None) or ""
+    if pgcode == "57014":
+        return f"Execution error: query cancelled by statement_timeout. {error}"
+    if pgcode.startswith("42") or pgcode.startswith("0A"):
+        return f"Planning error: {error}"
+    return f"Execution error: {error}"
+
+
+class QueryGuardError(Exception):
+    """Raised when the planner estimates that a query is too expensive to run."""
+
+
+def explain_query(conn, query):
+    """
+    Read the planner estimates of a query with EXPLAIN (FORMAT JSON), without running it.
+
+    Args:
+        conn: Open psycopg2 connection.
+        query: SELECT query.
+
+    Returns:
+        Dictionary with the estimated "total_cost" and "plan_rows" of the top plan node.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+        plan = cursor.fetchone()[0][0]["Plan"]
+    return {"total_cost": plan["Total Cost"], "plan_rows": plan["Plan Rows"]}
+
+
+def limit_query(query, limit):
+    """Wrap a query so that it returns at most `limit` rows."""
+    query = query.strip().rstrip(";")
+    # Quebra de linha antes do ")" para não ser engolido por um comentário "--" no fim da consulta
+    return f"SELECT * FROM (\n{query}\n) AS guarded_query LIMIT {int(limit)}"
+
+
+def guard_query(conn, query, max_total_cost, max_plan_rows, on_exceed="reject"):
+    """
+    Check the planner estimates of a query against cost and row thresholds.
+
+    Args:
+        conn: Open psycopg2 connection.
+        query: SELECT query.
+        max_total_cost: Maximum estimated planner cost.
+        max_plan_rows: Maximum estimated number of returned rows.
+        on_exceed: "reject" raises QueryGuardError; "limit" first tries to add LIMIT max_plan_rows
+            and only rejects if the limited query is still above max_total_cost.
+
+    Returns:
+        The query to run (unchanged, or wrapped with a LIMIT).
+
+    Raises:
+        QueryGuardError: If the query is above the thresholds and could not be limited.
+    """
+    estimates = explain_query(conn, query)
+    print(f"Estimativa do planner: custo {estimates['total_cost']:.0f}, {estimates['plan_rows']} linhas.")
+    if estimates["total_cost"] <= max_total_cost and estimates["plan_rows"] <= max_plan_rows:
+        return query
+
+    if on_exceed == "limit":
+        limited_query = limit_query(query, max_plan_rows)
+        limited_estimates = explain_query(conn, limited_query)
+        if limited_estimates["total_cost"] <= max_total_cost:
+            print(f"Consulta reescrita com LIMIT {max_plan_rows}.")
+            return limited_query
+        estimates = limited_estimates
+
+    raise QueryGuardError(
+        f"Cost guard: query rejected, estimated cost {estimates['total_cost']:.0f} (max {max_total_cost:.0f}) "
+        f"and estimated rows {estimates['plan_rows']} (max {max_plan_rows}). "
+        "Filter earlier, aggregate, avoid cross joins or add a LIMIT."
+    )
@@ -1,18 +1,37 @@
 import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import csv
+import io
 import json
+import os
+import time
+import validation
 
-def csv_to_postgres(db_config, table_name, csv_path, schema_path, truncate_table=True):
+def csv_to_postgres(db_config, table_name, csv_path, schema_path, truncate_table=True, load_method="copy",
+                    batch_size=50_000, validate=False, reject_path=None, chunk_size=100_000):
     """
-    Upload CSV data to PostgreSQL with schema validation.
+    Upload CSV, Parquet or Arrow data to PostgreSQL with schema validation.
 
     Args:
         db_config: Dictionary with PostgreSQL connection parameters (host, dbname, user, password, port).
         table_name: PostgreSQL table name.
-        csv_path: Path to CSV file.
+        csv_path: Path to CSV file, or to a Parquet (.parquet/.pq) or Arrow IPC (.arrow/.feather/.ipc) file.
         schema_path: Path to JSON schema file.
         truncate_table: Whether to truncate the table before inserting data.
+        load_method: "copy" streams the file through COPY FROM STDIN and falls back to row-by-row
+            inserts if the file is rejected; "insert" always uses row-by-row inserts. Parquet and
+            Arrow files are always loaded through COPY.
+        batch_size: Rows per record batch read from Parquet/Arrow files.
+        validate: Whether CSV files are validated against the schema in pandas chunks before loading
+            (see validation.CsvValidator); rejected rows go to reject_path and only clean rows are copied.
+        reject_path: Path of the reject file (default: "<csv_path>.rejects.csv").
+        chunk_size: Rows per validation chunk.
+
+    Returns:
+        Number of rows loaded, or None if the load failed.
     """
     # Load schema from JSON file
     try:
@@ -58,19 +77,29 @@ def csv_to_postgres(db_config, table_name, csv_path, schema_path, truncate_table
             return
 
     try:
-        print(f"Lendo o arquivo CSV: {csv_path}")
-        with open(csv_path, 'r', encoding='utf-8') as csv_file:
-            reader = csv.reader(csv_file)
-            headers = next(reader)  # Read the header row
-            print(f"Headers do CSV: {headers}")
-            insert_query = generate_insert_query(table_name, headers)
-            print(f"Query de inserção: {insert_query}")
-
-            for row in reader:
-                # Substituir strings vazias por None (equivalente a NULL no PostgreSQL)
-                row = [None if value == "" else value for value in row]
-                cursor.execute(insert_query, row)
+        print(f"Lendo o arquivo: {csv_path}")
+        start_time = time.perf_counter()
+        if detect_file_format(csv_path) != "csv":
+            row_count = copy_arrow_to_postgres(cursor, table_name, csv_path, schema_json, batch_size)
+        elif validate:
+            row_count = copy_validated_csv_to_postgres(cursor, table_name, csv_path, schema_json,
+                                                       reject_path or f"{csv_path}.rejects.csv", chunk_size)
+        elif load_method == "copy":
+            try:
+                # Savepoint para permitir o fallback sem perder o CREATE/TRUNCATE anteriores
+                cursor.execute("SAVEPOINT before_copy;")
+                row_count = copy_csv_to_postgres(cursor, table_name, csv_path)
+                cursor.execute("RELEASE SAVEPOINT before_copy;")
+            except psycopg2.Error as e:
+                print(f"Erro no COPY, usando inserção linha a linha: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT before_copy;")
+                row_count = insert_csv_to_postgres(cursor, table_name, csv_path)
+        else:
+            row_count = insert_csv_to_postgres(cursor, table_name, csv_path)
+        elapsed = time.perf_counter() - start_time
+        rows_per_second = row_count / elapsed if elapsed > 0 else float("inf")
         print(f"Dados do arquivo CSV '{csv_path}' inseridos com sucesso na tabela '{table_name}'.")
+        print(f"{row_count} linhas carregadas em {elapsed:.2f}s ({rows_per_second:.0f} linhas/s).")
     except Exception as e:
         print(f"Erro ao inserir dados do CSV: {e}")
         conn.close()
@@ -81,19 +110,218 @@ def csv_to_postgres(db_config, table_name, csv_path, schema_path, truncate_table
         print("Transação confirmada.")
     except Exception as e:
         print(f"Erro ao confirmar a transação: {e}")
+        row_count = None
     finally:
         cursor.close()
         conn.close()
         print("Conexão com o banco de dados encerrada.")
 
+    return row_count
+
+
+def copy_csv_to_postgres(cursor, table_name, csv_path):
+    """
+    Stream a CSV file into a table through COPY FROM STDIN.
+
+    Quoted and unquoted empty strings are both loaded as NULL, matching the
+    row-by-row insert path.
+
+    Args:
+        cursor: Open psycopg2 cursor.
+        table_name: PostgreSQL table name.
+        csv_path: Path to CSV file.
+
+    Returns:
+        Number of rows copied.
+    """
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+        headers = next(csv.reader(csv_file))
+        print(f"Headers do CSV: {headers}")
+        copy_query = generate_copy_query(table_name, headers)
+        print(f"Query de COPY: {copy_query}")
+        # Volta ao início para que o COPY consuma o cabeçalho com a opção HEADER
+        csv_file.seek(0)
+        cursor.copy_expert(copy_query, csv_file)
+    return cursor.rowcount
+
+
+def detect_file_format(path):
+    """Return "parquet", "arrow" or "csv" from the file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    return "csv"
+
+
+# Tipo Arrow usado para converter cada coluna antes do COPY, pelo tipo PostgreSQL do schema.json
+postgres_to_arrow_types = {
+    'TEXT': pa.string(),
+    'INTEGER': pa.int32(),
+    'REAL': pa.float64(),
+    'BOOLEAN': pa.bool_(),
+    'TIMESTAMP': pa.timestamp('us'),
+}
+
+
+def iter_arrow_batches(path, batch_size=50_000):
+    """
+    Read a Parquet or Arrow IPC file as record batches, keeping at most one batch in memory.
+
+    Args:
+        path: Path to a .parquet/.pq or .arrow/.feather/.ipc file.
+        batch_size: Rows per batch (Parquet only; Arrow files keep the batches they were written with).
 
-def generate_create_table_query(table_name, schema_json):
+    Returns:
+        Tuple (schema, iterator of record batches).
+    """
+    if detect_file_format(path) == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        return parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=batch_size)
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    return reader.schema, (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+
+class ArrowCsvStream(io.RawIOBase):
+    """File-like object that serializes record batches to CSV on demand, for cursor.copy_expert."""
+
+    def __init__(self, batches):
+        self.batches = iter(batches)
+        self.data = b""
+        self.position = 0
+        self.row_count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # Serializa o próximo batch só quando o anterior foi todo consumido pelo COPY
+        while self.position >= len(self.data):
+            batch = next(self.batches, None)
+            if batch is None:
+                return b""
+            sink = io.BytesIO()
+            pa_csv.write_csv(batch, sink, write_options=pa_csv.WriteOptions(include_header=False))
+            self.data = sink.getvalue()
+            self.position = 0
+            self.row_count += batch.num_rows
+        end = len(self.data) if size is None or size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+def copy_arrow_to_postgres(cursor, table_name, path, schema_json, batch_size=50_000):
+    """
+    Stream a Parquet or Arrow file into a table through COPY FROM STDIN.
+
+    The file is read in record batches and each column is cast once per batch to the type given by
+    map_json_type_to_postgres for its schema.json type, so no value goes through Python objects.
+    Only columns present in both the file and the schema are loaded; the others are left NULL.
+
+    Args:
+        cursor: Open psycopg2 cursor.
+        table_name: PostgreSQL table name.
+        path: Path to a Parquet or Arrow IPC file.
+        schema_json: JSON schema defining the table structure.
+        batch_size: Rows per record batch.
+
+    Returns:
+        Number of rows copied.
+    """
+    file_schema, batches = iter_arrow_batches(path, batch_size)
+    target_types = {field['name']: postgres_to_arrow_types.get(map_json_type_to_postgres(field['type']), pa.string())
+                    for field in schema_json}
+    columns = [name for name in file_schema.names if name in target_types]
+    print(f"Colunas do arquivo: {columns}")
+    target_schema = pa.schema([(name, target_types[name]) for name in columns])
+
+    def cast_batches():
+        for batch in batches:
+            yield pa.RecordBatch.from_arrays(
+                [batch.column(name).cast(target_types[name]) for name in columns], schema=target_schema)
+
+    copy_query = generate_copy_query(table_name, columns, header=False)
+    print(f"Query de COPY: {copy_query}")
+    stream = ArrowCsvStream(cast_batches())
+    cursor.copy_expert(copy_query, stream, size=1024 * 1024)
+    return stream.row_count
+
+
+def copy_validated_csv_to_postgres(cursor, table_name, csv_path, schema_json, reject_path, chunk_size=100_000):
+    """
+    Validate a CSV file in pandas chunks and stream only the clean rows through COPY FROM STDIN.
+
+    Args:
+        cursor: Open psycopg2 cursor.
+        table_name: PostgreSQL table name.
+        csv_path: Path to CSV file.
+        schema_json: JSON schema defining the table structure.
+        reject_path: Path of the CSV file that receives the rejected rows and their reasons.
+        chunk_size: Rows per validation chunk (bounds memory).
+
+    Returns:
+        Number of rows copied.
+    """
+    validator = validation.CsvValidator(schema_json, reject_path=reject_path, chunk_size=chunk_size)
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+        headers = next(csv.reader(csv_file))
+    copy_query = generate_copy_query(table_name, headers, header=False)
+    print(f"Query de COPY: {copy_query}")
+
+    # Cada chunk limpo vira um record batch de texto e é serializado só quando o COPY o consome
+    batches = (pa.RecordBatch.from_pandas(chunk[headers], preserve_index=False)
+               for chunk in validator.iter_clean_chunks(csv_path))
+    stream = ArrowCsvStream(batches)
+    cursor.copy_expert(copy_query, stream, size=1024 * 1024)
+
+    summary = validator.summary()
+    print(f"Validação: {summary['rows_read']} linhas lidas, {summary['rows_rejected']} rejeitadas.")
+    for reason, count in summary["reasons"].items():
+        print(f"  {count} x {reason}")
+    if summary["rows_rejected"]:
+        print(f"Linhas rejeitadas gravadas em '{reject_path}'.")
+    return stream.row_count
+
+
+def insert_csv_to_postgres(cursor, table_name, csv_path):
+    """
+    Insert a CSV file row by row. Slower than COPY, but tolerant of files that COPY rejects.
+
+    Args:
+        cursor: Open psycopg2 cursor.
+        table_name: PostgreSQL table name.
+        csv_path: Path to CSV file.
+
+    Returns:
+        Number of rows inserted.
+    """
+    row_count = 0
+    with open(csv_path, 'r', encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        headers = next(reader)  # Read the header row
+        print(f"Headers do CSV: {headers}")
+        insert_query = generate_insert_query(table_name, headers)
+        print(f"Query de inserção: {insert_query}")
+
+        for row in reader:
+            # Substituir strings vazias por None (equivalente a NULL no PostgreSQL)
+            row = [None if value == "" else value for value in row]
+            cursor.execute(insert_query, row)
+            row_count += 1
+    return row_count
+
+
+def generate_create_table_query(table_name, schema_json, primary_key=False):
     """
     Generate a CREATE TABLE query based on the schema JSON.
 
     Args:
         table_name: PostgreSQL table name.
         schema_json: JSON schema defining the table structure.
+        primary_key: Whether to add a PRIMARY KEY on the columns marked "primary_key": true
+            (only the incremental load needs it; full loads accept the file as it is).
 
     Returns:
         CREATE TABLE SQL query as a string.
@@ -105,6 +333,11 @@ def generate_create_table_query(table_name, schema_json):
         column_mode = 'NOT NULL' if field.get('mode', 'NULLABLE') == 'REQUIRED' else ''
         columns.append(f"{column_name} {column_type} {column_mode}")
 
+    # Colunas marcadas com "primary_key": true no schema.json (usadas pelo upsert incremental)
+    key_columns = [f'"{field["name"]}"' for field in schema_json if field.get('primary_key')]
+    if primary_key and key_columns:
+        columns.append(f"PRIMARY KEY ({', '.join(key_columns)})")
+
     columns_sql = ', '.join(columns)
     return f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_sql});"
 
@@ -144,6 +377,23 @@ def generate_insert_query(table_name, headers):
     placeholders = ', '.join(['%s'] * len(headers))
     return f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders});"
 
+def generate_copy_query(table_name, headers, header=True):
+    """
+    Generate a COPY FROM STDIN query for the given table and headers.
+
+    Args:
+        table_name: PostgreSQL table name.
+        headers: List of column names.
+        header: Whether the streamed CSV starts with a header row.
+
+    Returns:
+        COPY SQL query as a string.
+    """
+    columns = ', '.join([f'"{header}"' for header in headers])  # Escapar os nomes das colunas
+    # FORCE_NULL faz com que "" (vazio entre aspas) também seja carregado como NULL
+    return (f"COPY {table_name} ({columns}) FROM STDIN "
+            f"WITH (FORMAT csv, HEADER {'true' if header else 'false'}, FORCE_NULL ({columns}));")
+
 def test_postgres_connection(db_config):
     """
     Testa a conexão com o banco de dados PostgreSQL.
@@ -0,0 +1,289 @@
+import csv
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+
+from validation import boolean_values
+
+# Tipos do schema.json comparados por soma/mínimo/máximo; os demais, por nulos e tamanho total do texto
+numeric_types = {"INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC"}
+# Tipos cujo texto muda na carga ("yes" vira true, "2020-01-01" vira "2020-01-01 00:00:00"): booleanos são
+# comparados pela quantidade de verdadeiros e datas pelo mínimo/máximo em segundos desde 1970
+boolean_types = {"BOOLEAN", "BOOL"}
+datetime_types = {"DATETIME", "TIMESTAMP", "DATE"}
+
+
+def profile_csv(csv_path, schema_json=None, checksums=False, chunk_size=100_000):
+    """
+    Profile a CSV file without loading it whole into memory.
+
+    Without checksums the header and the row count come from a single csv.reader pass (quoted
+    newlines count as one row, blank lines are skipped as by read_csv). With checksums the file is
+    read in pandas chunks of chunk_size rows and, per column, the empty values (loaded as NULL) are
+    counted; numeric columns also get sum/min/max, boolean columns the number of true values,
+    date/time columns min/max in epoch seconds and the other columns the total text length.
+
+    Args:
+        csv_path: Path to CSV file.
+        schema_json: JSON schema of the table, used to pick how each column is compared.
+        checksums: Whether per-column checksums are computed.
+        chunk_size: Rows per chunk when computing checksums.
+
+    Returns:
+        Dictionary with columns, rows and checksums ({column: {nulls, sum, min, max}, {nulls, true},
+        {nulls, min, max} or {nulls, length}}).
+    """
+    types = {field["name"]: field["type"].upper() for field in schema_json or []}
+
+    if not checksums:
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            rows = sum(1 for row in reader if row)
+        return {"columns": columns, "rows": rows, "checksums": {}}
+
+    columns = None
+    rows = 0
+    totals = {}
+    for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunk_size, encoding="utf-8"):
+        if columns is None:
+            columns = list(chunk.columns)
+            totals = {column: {"nulls": 0} for column in columns}
+        rows += len(chunk)
+        for column in columns:
+            values = chunk[column]
+            blank = values == ""
+            total = totals[column]
+            total["nulls"] += int(blank.sum())
+            if types.get(column) in numeric_types:
+                numbers = pd.to_numeric(values[~blank], errors="coerce").dropna()
+                if len(numbers):
+                    total["sum"] = total.get("sum", 0.0) + float(numbers.sum())
+                    total["min"] = min(total.get("min", math.inf), float(numbers.min()))
+                    total["max"] = max(total.get("max", -math.inf), float(numbers.max()))
+            elif types.get(column) in boolean_types:
+                normalized = values[~blank].str.strip().str.lower().map(boolean_values)
+                total["true"] = total.get("true", 0) + int((normalized == "true").sum())
+            elif types.get(column) in datetime_types:
+                parsed = pd.to_datetime(values[~blank], errors="coerce", format="mixed").dropna()
+                if len(parsed):
+                    seconds = (parsed - pd.Timestamp(0)).dt.total_seconds()
+                    total["min"] = min(total.get("min", math.inf), float(seconds.min()))
+                    total["max"] = max(total.get("max", -math.inf), float(seconds.max()))
+            else:
+                total["length"] = total.get("length", 0) + int(values[~blank].str.len().sum())
+    return {"columns": columns or [], "rows": rows, "checksums": totals}
+
+
+def profile_postgres_table(cursor, table_name, schema_json=None, checksums=False, exact_count=False):
+    """
+    Profile a PostgreSQL table with the same measures as profile_csv.
+
+    Without checksums and exact_count the row count is the estimate kept in pg_stat_user_tables, so
+    no table scan is needed; with checksums every measure (including the exact count) comes from a
+    single aggregate query.
+
+    Args:
+        cursor: Open psycopg2 cursor.
+        table_name: PostgreSQL table name.
+        schema_json: JSON schema of the table, used to pick how each column is compared.
+        checksums: Whether per-column checksums are computed.
+        exact_count: Whether the row count is exact (SELECT count(*)) when checksums are off.
+
+    Returns:
+        Dictionary with columns, rows, rows_estimated and checksums.
+    """
+    types = {field["name"]: field["type"].upper() for field in schema_json or []}
+
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position;
+    """, (table_name,))
+    columns = [row[0] for row in cursor.fetchall()]
+
+    if not checksums:
+        rows = None
+        if not exact_count:
+            cursor.execute("SELECT n_live_tup FROM pg_stat_user_tables WHERE relid = %s::regclass;", (table_name,))
+            result = cursor.fetchone()
+            rows = result[0] if result else None
+        if rows is None:
+            cursor.execute(sql.SQL("SELECT count(*) FROM {};").format(sql.Identifier(table_name)))
+            return {"columns": columns, "rows": cursor.fetchone()[0], "rows_estimated": False, "checksums": {}}
+        return {"columns": columns, "rows": rows, "rows_estimated": True, "checksums": {}}
+
+    expressions = [sql.SQL("count(*)")]
+    layout = []
+    for column in columns:
+        identifier = sql.Identifier(column)
+        expressions.append(sql.SQL("count(*) - count({})").format(identifier))
+        if types.get(column) in numeric_types:
+            # float8 para a soma de colunas REAL não perder precisão no servidor
+            expressions.extend([sql.SQL("sum({}::float8)").format(identifier),
+                                sql.SQL("min({}::float8)").format(identifier),
+                                sql.SQL("max({}::float8)").format(identifier)])
+            layout.append((column, ["nulls", "sum", "min", "max"]))
+        elif types.get(column) in boolean_types:
+            expressions.append(sql.SQL("count(*) FILTER (WHERE {})").format(identifier))
+            layout.append((column, ["nulls", "true"]))
+        elif types.get(column) in datetime_types:
+            expressions.extend([sql.SQL("extract(epoch FROM min({}::timestamp))").format(identifier),
+                                sql.SQL("extract(epoch FROM max({}::timestamp))").format(identifier)])
+            layout.append((column, ["nulls", "min", "max"]))
+        else:
+            expressions.append(sql.SQL("coalesce(sum(char_length({}::text)), 0)").format(identifier))
+            layout.append((column, ["nulls", "length"]))
+    cursor.execute(sql.SQL("SELECT {} FROM {};").format(sql.SQL(", ").join(expressions),
+                                                        sql.Identifier(table_name)))
+    values = list(cursor.fetchone())
+
+    rows = values.pop(0)
+    totals = {}
+    for column, measures in layout:
+        total = {}
+        for measure in measures:
+            value = values.pop(0)
+            if value is not None:
+                total[measure] = float(value) if measure in ("sum", "min", "max") else int(value)
+        totals[column] = total
+    return {"columns": columns, "rows": rows, "rows_estimated": False, "checksums": totals}
+
+
+def diff_profiles(csv_profile, table_profile, relative_tolerance=1e-4):
+    """
+    Compare a CSV profile with a table profile.
+
+    Sums, minimums and maximums are compared with relative_tolerance, since REAL columns keep
+    single precision. A different estimated row count is a warning, not a mismatch.
+
+    Returns:
+        List of differences, each a dictionary with check, column, csv, database and severity.
+    """
+    differences = []
+    csv_columns = csv_profile["columns"]
+    table_columns = table_profile["columns"]
+    for column in csv_columns:
+        if column not in table_columns:
+            differences.append({"check": "column", "column": column, "csv": "present", "database": "missing",
+                                "severity": "mismatch"})
+    for column in table_columns:
+        if column not in csv_columns:
+            differences.append({"check": "column", "column": column, "csv": "missing", "database": "present",
+                                "severity": "mismatch"})
+
+    if csv_profile["rows"] != table_profile["rows"]:
+        differences.append({"check": "rows", "column": None, "csv": csv_profile["rows"],
+                            "database": table_profile["rows"],
+                            "severity": "warning" if table_profile.get("rows_estimated") else "mismatch"})
+
+    for column, csv_totals in csv_profile["checksums"].items():
+        table_totals = table_profile["checksums"].get(column)
+        if table_totals is None:
+            continue
+        for measure, csv_value in csv_totals.items():
+            table_value = table_totals.get(measure)
+            if measure in ("sum", "min", "max"):
+                equal = table_value is not None and math.isclose(csv_value, table_value, rel_tol=relative_tolerance,
+                                                                 abs_tol=relative_tolerance)
+            else:
+                equal = csv_value == table_value
+            if not equal:
+                differences.append({"check": measure, "column": column, "csv": csv_value, "database": table_value,
+                                    "severity": "mismatch"})
+    return differences
+
+
+def reconcile_table(db_config, table_name, csv_path, schema_path=None, checksums=False, exact_count=False):
+    """
+    Reconcile a CSV file with the PostgreSQL table it was loaded into.
+
+    Args:
+        db_config: Dictionary with PostgreSQL connection parameters (host, dbname, user, password, port).
+        table_name: PostgreSQL table name.
+        csv_path: Path to CSV file.
+        schema_path: Path to JSON schema file (needed to compare sums/min/max of numeric columns).
+        checksums: Whether per-column checksums are compared.
+        exact_count: Whether the table row count is exact when checksums are off.
+
+    Returns:
+        Report dictionary with table_name, status (ok, warning, mismatch or error), csv_rows,
+        database_rows, rows_estimated, differences, error and seconds.
+    """
+    start_time = time.perf_counter()
+    report = {"table_name": table_name, "status": "error", "csv_rows": None, "database_rows": None,
+              "rows_estimated": False, "differences": [], "error": ""}
+    try:
+        schema_json = None
+        if schema_path:
+            with open(schema_path, 'r', encoding='utf-8') as f:
+                schema_json = json.load(f)
+        csv_profile = profile_csv(csv_path, schema_json, checksums=checksums)
+        report["csv_rows"] = csv_profile["rows"]
+
+        conn = psycopg2.connect(**db_config)
+        try:
+            with conn.cursor() as cursor:
+                table_profile = profile_postgres_table(cursor, table_name, schema_json, checksums=checksums,
+                                                       exact_count=exact_count)
+        finally:
+            conn.close()
+
+        differences = diff_profiles(csv_profile, table_profile)
+        report.update({
+            "database_rows": table_profile["rows"],
+            "rows_estimated": table_profile["rows_estimated"],
+            "differences": differences,
+            "status": ("mismatch" if any(d["severity"] == "mismatch" for d in differences)
+                       else "warning" if differences else "ok"),
+        })
+    except Exception as e:
+        report["error"] = str(e)
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def reconcile_manifest(db_config, manifest, checksums=False, exact_count=False, max_workers=5):
+    """
+    Reconcile every dataset of the manifest in parallel (one connection per worker).
+
+    Args:
+        db_config: Dictionary with PostgreSQL connection parameters.
+        manifest: List of entries as returned by ingestion.load_manifest.
+        checksums: Whether per-column checksums are compared.
+        exact_count: Whether the table row counts are exact when checksums are off.
+        max_workers: Maximum number of tables reconciled at the same time.
+
+    Returns:
+        List of reports (see reconcile_table), in manifest order.
+    """
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        reports = list(executor.map(
+            lambda entry: reconcile_table(db_config, entry["table_name"], entry["csv_path"],
+                                          entry.get("schema_path"), checksums=checksums, exact_count=exact_count),
+            manifest))
+    print_reconciliation_report(reports, time.perf_counter() - start_time)
+    return reports
+
+
+def print_reconciliation_report(reports, elapsed=None):
+    print("\nReconciliação CSV x PostgreSQL:")
+    for report in reports:
+        estimated = " (estimado)" if report["rows_estimated"] else ""
+        print(f"  {report['table_name']:<30} {report['status']:<9} CSV {report['csv_rows']} linhas, "
+              f"PostgreSQL {report['database_rows']} linhas{estimated} em {report['seconds']:.2f}s")
+        if report["error"]:
+            print(f"    erro: {report['error']}")
+        for difference in report["differences"]:
+            column = f" [{difference['column']}]" if difference["column"] else ""
+            print(f"    {difference['severity']}: {difference['check']}{column} "
+                  f"CSV={difference['csv']} PostgreSQL={difference['database']}")
+    if elapsed is not None:
+        print(f"  Tempo total: {elapsed:.2f}s")
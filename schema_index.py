@@ -0,0 +1,253 @@
+import csv
+import glob
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+
+# Palavras muito comuns nas perguntas que não ajudam a escolher tabelas
+STOPWORDS = {
+    "a", "an", "and", "are", "by", "de", "do", "da", "did", "em", "for", "from", "how", "in", "is",
+    "me", "many", "much", "na", "no", "o", "of", "on", "or", "os", "para", "por", "quais", "qual",
+    "quantos", "quantas", "show", "that", "the", "to", "what", "which", "with", "were", "was",
+}
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search tokens.
+
+    snake_case and camelCase identifiers are split into words and a trailing plural "s" is dropped,
+    so "release_year" matches "released year" and "movies" matches "movie".
+
+    Args:
+        text: Free text, table name or column name.
+
+    Returns:
+        List of tokens.
+    """
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text or "")
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over pre-tokenized documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokens) for tokens in documents]
+        self.document_lengths = [len(tokens) for tokens in documents]
+        self.average_length = sum(self.document_lengths) / len(documents) if documents else 0.0
+        document_frequencies = Counter(term for tf in self.term_frequencies for term in tf)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequencies.items()}
+
+    def score(self, query_tokens):
+        """
+        Score every document against the query.
+
+        Args:
+            query_tokens: Tokens of the query.
+
+        Returns:
+            List with one score per document, in the order the documents were indexed.
+        """
+        scores = []
+        for tf, length in zip(self.term_frequencies, self.document_lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            score = 0.0
+            for term in query_tokens:
+                frequency = tf.get(term, 0)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+
+def load_schema_descriptions(datasets_dir="datasets"):
+    """
+    Load table and column descriptions from tables_descriptions.csv and every schema.json.
+
+    Args:
+        datasets_dir: Directory with one sub-directory per table.
+
+    Returns:
+        Dictionary {table_name: {"description": str, "columns": {column_name: description}}}.
+    """
+    descriptions = {}
+    for schema_path in glob.glob(os.path.join(datasets_dir, "*", "schema.json")):
+        table_name = os.path.basename(os.path.dirname(schema_path))
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            schema_json = json.load(f)
+        descriptions[table_name] = {
+            "description": "",
+            "columns": {field["name"]: field.get("description", "") for field in schema_json},
+        }
+
+    tables_descriptions_path = os.path.join(datasets_dir, "tables_descriptions", "tables_descriptions.csv")
+    if os.path.exists(tables_descriptions_path):
+        with open(tables_descriptions_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                table = descriptions.setdefault(row["table_id"], {"description": "", "columns": {}})
+                table["description"] = row["description"].strip()
+    return descriptions
+
+
+def estimate_tokens(text):
+    """Rough token count used for the prompt budget (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def prune_catalog(question, catalog, descriptions, top_k_tables=3, max_tokens=2000):
+    """
+    Keep only the tables and columns most relevant to the question.
+
+    Tables are ranked with BM25 over their name, description, column names and column descriptions,
+    and the top_k_tables best are kept. Tables that match no word of the question are dropped, unless
+    no table matches at all (then the ranking falls back to the whole catalog). Columns of a kept table are dropped, least relevant first,
+    only when the whole table does not fit in the remaining token budget.
+
+    Args:
+        question: User question.
+        catalog: List of tuples (schema, table, [(column, type), ...]).
+        descriptions: Output of load_schema_descriptions.
+        top_k_tables: Maximum number of tables kept.
+        max_tokens: Approximate token budget for the formatted schemas.
+
+    Returns:
+        Pruned catalog, in the same format and with tables ordered by relevance.
+    """
+    if not catalog:
+        return catalog
+
+    table_documents = []
+    column_documents = []
+    for schema, table, columns in catalog:
+        table_description = descriptions.get(table, {"description": "", "columns": {}})
+        column_texts = [f"{column} {table_description['columns'].get(column, '')}" for column, _ in columns]
+        table_documents.append(tokenize(f"{table} {table_description['description']} {' '.join(column_texts)}"))
+        column_documents.extend(tokenize(text) for text in column_texts)
+
+    query_tokens = tokenize(question)
+    table_scores = BM25Index(table_documents).score(query_tokens)
+    column_scores = BM25Index(column_documents).score(query_tokens)
+
+    # Separa os scores das colunas por tabela, na mesma ordem do catálogo
+    scores_by_table = []
+    offset = 0
+    for _, _, columns in catalog:
+        scores_by_table.append(column_scores[offset:offset + len(columns)])
+        offset += len(columns)
+
+    ranked = sorted(range(len(catalog)), key=lambda i: table_scores[i], reverse=True)
+    # Tabelas sem nenhuma palavra da pergunta só ocupariam o prompt
+    matching = [i for i in ranked if table_scores[i] > 0]
+    ranked = (matching or ranked)[:top_k_tables]
+
+    pruned = []
+    remaining_tokens = max_tokens
+    for i in ranked:
+        schema, table, columns = catalog[i]
+        header_tokens = estimate_tokens(f"{schema}.{table}: ")
+        column_tokens = [estimate_tokens(f"{column} ({data_type}), ") for column, data_type in columns]
+        if header_tokens + sum(column_tokens) <= remaining_tokens:
+            kept = list(range(len(columns)))
+        else:
+            kept = []
+            budget = remaining_tokens - header_tokens
+            by_relevance = sorted(range(len(columns)), key=lambda j: scores_by_table[i][j], reverse=True)
+            for j in by_relevance:
+                if column_tokens[j] <= budget:
+                    kept.append(j)
+                    budget -= column_tokens[j]
+            kept.sort()
+        if not kept:
+            break
+        pruned.append((schema, table, [columns[j] for j in kept]))
+        remaining_tokens -= header_tokens + sum(column_tokens[j] for j in kept)
+    return pruned
+
+
+class LocalTableRetriever:
+    """
+    Offline replacement for the VertexAISearchRetriever used to pick tables in workflow.py.
+
+    Indexes every row of tables_descriptions.csv together with the column names and descriptions of
+    the table's schema.json with BM25. The tokenized documents are persisted to index_path and
+    reused while the source files do not change. invoke returns Documents whose page_content is the
+    CSV row as JSON (project_id, dataset_id, table_id, description), like the Vertex data store.
+    """
+
+    def __init__(self, datasets_dir="datasets", index_path=".table_index.json", max_documents=2):
+        self.datasets_dir = datasets_dir
+        self.index_path = index_path
+        self.max_documents = max_documents
+        self.rows, documents = self._load_or_build()
+        self.index = BM25Index(documents)
+
+    def _source_paths(self):
+        return sorted([os.path.join(self.datasets_dir, "tables_descriptions", "tables_descriptions.csv")]
+                      + glob.glob(os.path.join(self.datasets_dir, "*", "schema.json")))
+
+    def _source_fingerprint(self):
+        fingerprint = []
+        for path in self._source_paths():
+            stat = os.stat(path)
+            fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+        return fingerprint
+
+    def _load_or_build(self):
+        fingerprint = self._source_fingerprint()
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if index["fingerprint"] == fingerprint:
+                    return index["rows"], index["documents"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Índice de tabelas inválido, reconstruindo: {e}")
+
+        descriptions = load_schema_descriptions(self.datasets_dir)
+        rows = []
+        documents = []
+        tables_descriptions_path = os.path.join(self.datasets_dir, "tables_descriptions", "tables_descriptions.csv")
+        with open(tables_descriptions_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                row = {key: value.strip() for key, value in row.items()}
+                columns = descriptions.get(row["table_id"], {"columns": {}})["columns"]
+                column_texts = [f"{column} {description}" for column, description in columns.items()]
+                rows.append(row)
+                documents.append(tokenize(f"{row['table_id']} {row['description']} {' '.join(column_texts)}"))
+
+        if self.index_path:
+            try:
+                with open(self.index_path, 'w', encoding='utf-8') as f:
+                    json.dump({"fingerprint": fingerprint, "rows": rows, "documents": documents}, f)
+            except OSError as e:
+                print(f"Não foi possível salvar o índice de tabelas: {e}")
+        return rows, documents
+
+    def invoke(self, question):
+        """
+        Return the tables that best match the question.
+
+        Args:
+            question: User question.
+
+        Returns:
+            Up to max_documents Documents, best match first, with the table row as JSON page_content.
+        """
+        scores = self.index.score(tokenize(question))
+        ranked = sorted(range(len(self.rows)), key=lambda i: scores[i], reverse=True)[:self.max_documents]
+        return [Document(page_content=json.dumps(self.rows[i]), metadata={"score": scores[i]}) for i in ranked]
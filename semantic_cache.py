@@ -0,0 +1,219 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# Só artigos, preposições e verbos auxiliares: palavras de intenção ("how many", "which", "show",
+# "total"...) ficam, ao contrário do schema_index.tokenize, porque mudam o SQL da resposta
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "by", "from", "with", "and", "or", "is",
+    "are", "was", "were", "be", "been", "did", "do", "does", "de", "da", "das", "dos", "em", "na",
+    "no", "nas", "nos", "o", "os", "as", "e", "para", "por", "com", "foi", "foram",
+}
+
+# Intenção/agregação da pergunta: "how many movies" (count) e "which movies" (lista) nunca são equivalentes
+INTENT_WORDS = {
+    "count": {"many", "count", "number", "quantos", "quantas", "quantidade", "numero", "número"},
+    "sum": {"total", "sum", "soma"},
+    "average": {"average", "avg", "mean", "media", "média"},
+    "list": {"list", "which", "show", "what", "quais", "qual", "liste", "listar", "mostre", "mostrar"},
+    "top": {"top", "ranking", "rank"},
+}
+
+# Palavras que invertem ou ordenam o sentido da pergunta: perguntas que diferem nelas nunca são
+# equivalentes, por mais parecidas que sejam ("highest" x "lowest", "canceled" x "not canceled")
+NEGATION_WORDS = {
+    "not", "no", "never", "without", "except", "excluding", "exclude", "non", "nao", "não", "nunca",
+    "sem", "exceto", "nenhum", "nenhuma",
+}
+COMPARISON_WORDS = {
+    "highest", "lowest", "most", "least", "top", "bottom", "max", "min", "maximum", "minimum", "first",
+    "last", "more", "less", "fewer", "greater", "smaller", "larger", "largest", "smallest", "biggest",
+    "best", "worst", "above", "below", "over", "under", "before", "after", "earliest", "latest",
+    "oldest", "newest", "asc", "desc", "ascending", "descending", "increasing", "decreasing", "maior",
+    "maiores", "menor", "menores", "mais", "menos", "primeiro", "primeiros", "último", "últimos",
+    "acima", "abaixo", "antes", "depois", "pior", "piores", "melhor", "melhores",
+}
+
+
+def tokenize(text):
+    """
+    Split a question into lowercase tokens for the semantic cache.
+
+    Unlike schema_index.tokenize only articles/prepositions are dropped, so intent and aggregation
+    words are kept; a trailing plural "s" is dropped, so "movies" matches "movie".
+    """
+    tokens = []
+    for token in re.findall(r"\w+", (text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def intents(text):
+    """Return the intent/aggregation classes of a question (count, sum, average, list, top)."""
+    words = set(re.findall(r"\w+", (text or "").lower()))
+    return frozenset(intent for intent, intent_words in INTENT_WORDS.items() if words & intent_words)
+
+
+class HashingEmbedder:
+    """
+    Local CPU embedding: hashed counts of words, word bigrams and character trigrams, L2-normalized.
+
+    Needs no model download, but only measures word overlap: paraphrases with different words score
+    low and questions with opposite meanings score high. SemanticCache therefore only accepts its
+    matches when both questions have the same content words (see require_same_tokens).
+    """
+
+    def __init__(self, dimensions=4096):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        words = tokenize(text)
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            # crc32 em vez de hash() para ser estável entre processos
+            vector[zlib.crc32(feature.encode("utf-8")) % self.dimensions] += 1.0
+        return vector
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local sentence-embedding model from sentence-transformers (optional dependency, runs on CPU).
+
+    The model is downloaded on first use and cached by sentence-transformers.
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+
+    def embed_query(self, text):
+        return self.model.encode(text, normalize_embeddings=True)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of validated (question, query) pairs.
+
+    Questions are embedded and compared with cosine similarity against a NumPy matrix of previous
+    questions; a match above `threshold` returns the stored query. Entries are scoped by a context
+    (e.g. a fingerprint of the catalog the query was written against) and questions whose numbers,
+    negation words, comparison words or intent (see intents) differ (2020 vs 2021, "highest" vs
+    "lowest", "canceled" vs "not canceled", "how many movies" vs "which movies") never match,
+    whatever the similarity. With require_same_tokens (the default for
+    HashingEmbedder) the questions must also have the same content words apart from stopwords.
+
+    Any LangChain-style embeddings object with an `embed_query(text)` method can be used as embedder,
+    e.g. SentenceTransformerEmbedder.
+    """
+
+    def __init__(self, embedder=None, threshold=0.9, maxsize=1000, require_same_tokens=None):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.require_same_tokens = (isinstance(self.embedder, HashingEmbedder) if require_same_tokens is None
+                                    else require_same_tokens)
+        self._matrix = None
+        self._entries = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._writer_seconds_total = 0.0
+        self._writer_calls = 0
+
+    def _embed(self, question):
+        vector = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _guard(self, question):
+        # O que precisa ser igual nas duas perguntas para o SQL de uma servir à outra
+        words = set(re.findall(r"\w+", question.lower()))
+        guard = (frozenset(token for token in tokenize(question) if token.isdigit()),
+                 frozenset(words & NEGATION_WORDS), frozenset(words & COMPARISON_WORDS), intents(question))
+        if self.require_same_tokens:
+            guard += (frozenset(tokenize(question)),)
+        return guard
+
+    def lookup(self, question, context=None):
+        """
+        Return the stored query of the most similar cached question, or None.
+
+        Args:
+            question: User question.
+            context: Fingerprint of the catalog the query will run against; only entries stored with
+                the same context match.
+        """
+        vector = self._embed(question)
+        guard = self._guard(question)
+        with self._lock:
+            if self._matrix is not None:
+                similarities = self._matrix @ vector
+                for i in np.argsort(similarities)[::-1]:
+                    if similarities[i] < self.threshold:
+                        break
+                    cached_question, query, cached_context, cached_guard = self._entries[i]
+                    if cached_context == context and cached_guard == guard:
+                        self.hits += 1
+                        if self._writer_calls:
+                            self.seconds_saved += self._writer_seconds_total / self._writer_calls
+                        print(f"Cache semântico: '{question}' ~ '{cached_question}' "
+                              f"(similaridade {similarities[i]:.3f})")
+                        return query
+            self.misses += 1
+            return None
+
+    def add(self, question, query, context=None):
+        """
+        Store a validated (question, query) pair.
+
+        Args:
+            question: User question.
+            query: SQL query that passed validation for this question.
+            context: Fingerprint of the catalog the query was validated against.
+        """
+        vector = self._embed(question)
+        entry = (question, query, context, self._guard(question))
+        with self._lock:
+            for i, (cached_question, _, cached_context, _) in enumerate(self._entries):
+                if cached_question == question and cached_context == context:
+                    self._entries[i] = entry
+                    return
+            self._entries.append(entry)
+            rows = [vector] if self._matrix is None else [self._matrix, vector[np.newaxis, :]]
+            self._matrix = np.vstack(rows)
+            if len(self._entries) > self.maxsize:
+                # Remove a entrada mais antiga
+                self._entries.pop(0)
+                self._matrix = self._matrix[1:]
+
+    def record_writer_latency(self, seconds):
+        """Record the latency of a writer LLM call, used to estimate the time saved by each hit."""
+        with self._lock:
+            self._writer_seconds_total += seconds
+            self._writer_calls += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+        }
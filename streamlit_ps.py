@@ -1,7 +1,61 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import workflow_ps
+
+# Progress messages shown while each node of the graph runs
+node_labels = {
+    "result_cache": "Loaded the answer from the result cache",
+    "search_tables_and_schemas": "Selected the relevant tables",
+    "agent_sql_writer_node": "Wrote the SQL query",
+    "agent_sql_validator_node": "Validated the SQL query",
+    "heuristic_visualization_node": "Picked the visualization",
+    "agent_bi_expert_node": "Planned the visualization",
+    "agent_python_code_data_visualization_generator_node": "Generated the visualization code",
+    "agent_bi_expert_and_visualization_generator_node": "Planned and generated the visualization",
+    "agent_python_code_data_visualization_validator_node": "Validated the visualization",
+}
+
+
+@st.cache_resource(show_spinner="Loading the SQL agent...")
+def load_workflow():
+    """Build the LLM client, compiled graphs, DB pool and visualization workers once per server process."""
+    import workflow_ps
+
+    workflow_ps.ps_database.get_pool(workflow_ps.db_config)
+    if workflow_ps.visualization_execution_mode == "process_pool":
+        workflow_ps.viz_executor.get_executor()
+    return workflow_ps
+
+
+def validation_finished(state, result_key, retries_key):
+    """Whether a validator is done: it passed or used all its retries (otherwise the graph runs it again)."""
+    return state[result_key] == "Pass" or state[retries_key] >= state["max_num_retries_debug"]
+
+
+def render_sql(container, state):
+    with container.container():
+        st.subheader("Generated SQL Query")
+        st.code(state.get("query") or "No SQL generated", language="sql")
+        if state.get("result_truncated"):
+            st.caption("The result was truncated to the configured row/byte limits.")
+
+
+def render_result(container, state):
+    with container.container():
+        # Display Charts
+        st.subheader("Result")
+        variables = state.get("python_code_store_variables_dict") or {}
+        fig = variables.get("fig", None)
+        string_viz_result = variables.get("string_viz_result", None)
+        df_viz = variables.get("df_viz", None)
+        if fig is None:
+            if df_viz is not None:
+                st.table(df_viz)
+            else:
+                st.markdown(string_viz_result)
+        else:
+            st.plotly_chart(fig)
+
 
 # Page configuration
 st.set_page_config(page_title="SQL BI Agent", layout="wide")
@@ -26,36 +80,57 @@ question = st.text_input("Ask your data question:",
                         placeholder="e.g., Show sales trends by month",
                         key="user_question")
 
-if st.button("Run") and question:
-    # Run the LangGraph workflow
-    
-    try:
-        langraph_state = workflow_ps.run_workflow(question)
-        
-        col1, col2 = st.columns([0.4,0.6])
-
-        with col1:
-            # Display generated SQL
-            st.subheader("Generated SQL Query")
-            st.code(langraph_state.get("query", "No SQL generated"), language="sql")
-
-        with col2:
-            # Display Charts
-            st.subheader("Result")
-            fig = langraph_state.get("python_code_store_variables_dict").get("fig", None)
-            string_viz_result = langraph_state.get("python_code_store_variables_dict").get("string_viz_result", None)
-            df_viz = langraph_state.get("python_code_store_variables_dict").get("df_viz", None)
-            if fig is None:
-                if df_viz is not None:
-                    st.table(df_viz)
+# Answers already computed in this session, by normalized question
+if "results" not in st.session_state:
+    st.session_state["results"] = {}
+
+try:
+    workflow_ps = load_workflow()
+except Exception as e:
+    st.error(f"Error loading the SQL agent: {str(e)}")
+    st.stop()
+
+result_key = workflow_ps.normalize_question(question) if question else None
+run_clicked = st.button("Run")
+
+if question and (run_clicked or result_key in st.session_state["results"]):
+    col1, col2 = st.columns([0.4,0.6])
+    sql_container = col1.empty()
+    result_container = col2.empty()
+
+    if result_key in st.session_state["results"]:
+        langraph_state = st.session_state["results"][result_key]
+        render_sql(sql_container, langraph_state)
+        render_result(result_container, langraph_state)
+    else:
+        # Run the LangGraph workflow node by node, showing the SQL as soon as it is validated
+        try:
+            with st.status("Running the SQL agent...", expanded=False) as status:
+                langraph_state = None
+                for node_name, langraph_state in workflow_ps.stream_workflow(question):
+                    status.update(label=node_labels.get(node_name, node_name) + "...")
+                    st.write(node_labels.get(node_name, node_name))
+                    # Intermediate attempts of a validator are not drawn: each would repaint the panel
+                    if node_name == "result_cache" or (
+                            node_name == "agent_sql_validator_node"
+                            and validation_finished(langraph_state, "result_debug_sql", "num_retries_debug_sql")):
+                        render_sql(sql_container, langraph_state)
+                    if node_name == "result_cache" or (
+                            node_name == "agent_python_code_data_visualization_validator_node"
+                            and validation_finished(langraph_state, "result_debug_python_code_data_visualization",
+                                                    "num_retries_debug_python_code_data_visualization")):
+                        render_result(result_container, langraph_state)
+
+                if (langraph_state is not None
+                        and langraph_state["result_debug_sql"] == "Pass"
+                        and langraph_state["result_debug_python_code_data_visualization"] == "Pass"):
+                    st.session_state["results"][result_key] = langraph_state
+                    status.update(label="Done", state="complete")
                 else:
-                    st.markdown(string_viz_result)
-            else:
-                st.plotly_chart(fig)
-                
-    except Exception as e:
-        st.error(f"Error processing your request: {str(e)}")
+                    status.update(label="Could not answer this question", state="error")
+
+        except Exception as e:
+            st.error(f"Error processing your request: {str(e)}")
 
 elif not question:
     st.warning("Please enter a question")
-
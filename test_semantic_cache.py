@@ -0,0 +1,21 @@
+from semantic_cache import SemanticCache
+
+
+def test_count_question_does_not_answer_list_questions():
+    cache = SemanticCache()
+    cache.add("How many movies were released in 2020 on netflix?", "SELECT count(*) FROM netflix", context="c1")
+
+    assert cache.lookup("Which movies were released in 2020 on netflix?", context="c1") is None
+    assert cache.lookup("Show the movies released in 2020 on netflix", context="c1") is None
+    assert cache.lookup("how many movies were released in 2020 on netflix", context="c1") == \
+        "SELECT count(*) FROM netflix"
+
+
+def test_opposite_questions_and_other_catalogs_do_not_match():
+    cache = SemanticCache()
+    cache.add("Which game has the highest global sales?", "SELECT ... DESC", context="c1")
+    cache.add("average price of bookings canceled", "SELECT ... = 1", context="c1")
+
+    assert cache.lookup("Which game has the lowest global sales?", context="c1") is None
+    assert cache.lookup("average price of bookings not canceled", context="c1") is None
+    assert cache.lookup("Which game has the highest global sales?", context="c2") is None
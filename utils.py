@@ -1,4 +1,7 @@
 import re
+import threading
+import time
+from collections import OrderedDict
 
 def extract_code_block(content: str, language: str) -> str: 
     try:
@@ -8,3 +11,45 @@ def extract_code_block(content: str, language: str) -> str:
         extracted_code = content.replace(f"```", "")
 
     return extracted_code
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds (ttl=None never expires)."""
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,203 @@
+import csv
+import os
+from collections import Counter
+
+import pandas as pd
+
+# Limites do INTEGER do PostgreSQL (map_json_type_to_postgres mapeia INTEGER -> INTEGER de 32 bits)
+postgres_integer_bounds = (-2**31, 2**31 - 1)
+
+# Valores aceitos pelo PostgreSQL para BOOLEAN, normalizados para true/false
+boolean_values = {
+    "true": "true", "t": "true", "yes": "true", "y": "true", "on": "true", "1": "true",
+    "false": "false", "f": "false", "no": "false", "n": "false", "off": "false", "0": "false",
+}
+
+
+class CsvValidator:
+    """
+    Validate and coerce a CSV file against schema.json in pandas chunks before it reaches the database.
+
+    Each chunk is read as text and checked column by column with vectorized operations: REQUIRED
+    and primary key columns must not be empty, INTEGER values must be whole numbers inside integer_bounds, FLOAT
+    values must be numeric, BOOLEAN values must be a known literal and DATETIME values must parse
+    (they are rewritten in ISO format). A primary key (schema.json "primary_key": true) already seen
+    in an earlier row of the file, in any chunk, is rejected, so the first row of each key is kept.
+    Rows with more fields than the header are always rejected;
+    rows with fewer get NULL in the missing columns, so REQUIRED columns still reject them. Rows
+    that fail any check are appended to reject_path with their row number and the reasons; only the
+    clean rows are yielded.
+    """
+
+    def __init__(self, schema_json, reject_path=None, chunk_size=100_000, datetime_format=None,
+                 integer_bounds=postgres_integer_bounds):
+        self.schema_json = schema_json
+        self.reject_path = reject_path
+        self.chunk_size = chunk_size
+        self.datetime_format = datetime_format
+        self.integer_bounds = integer_bounds
+        self.rows_read = 0
+        self.rows_rejected = 0
+        self.reasons = Counter()
+        self._reject_columns = None
+        self._seen_keys = set()
+
+    def validate_chunk(self, chunk):
+        """
+        Validate one chunk read as text (dtype=str, keep_default_na=False).
+
+        Args:
+            chunk: DataFrame with the raw CSV values.
+
+        Returns:
+            Tuple (clean DataFrame with coerced values, Series with the reasons of each rejected row).
+        """
+        reasons = pd.Series("", index=chunk.index)
+
+        def reject(mask, reason):
+            if mask.any():
+                reasons[mask] = reasons[mask] + reason + "; "
+                self.reasons[reason] += int(mask.sum())
+
+        # Linhas com menos campos que o cabeçalho chegam com os últimos campos vazios (NULL)
+        chunk = chunk.fillna("")
+
+        for field in self.schema_json:
+            name = field["name"]
+            if name not in chunk.columns:
+                continue
+            values = chunk[name].str.strip()
+            blank = values == ""
+            field_type = field["type"].upper()
+
+            if field.get("mode", "NULLABLE") == "REQUIRED" or field.get("primary_key"):
+                reject(blank, f"{name}: obrigatório e vazio")
+
+            if field_type in ("INTEGER", "INT64"):
+                is_integer = values.str.fullmatch(r"[+-]?\d+")
+                numbers = pd.to_numeric(values.where(is_integer), errors="coerce")
+                low, high = self.integer_bounds
+                out_of_range = is_integer & ((numbers < low) | (numbers > high))
+                reject(~blank & ~is_integer, f"{name}: não é um inteiro")
+                reject(out_of_range, f"{name}: inteiro fora do intervalo")
+                chunk[name] = values
+            elif field_type in ("FLOAT", "FLOAT64", "NUMERIC"):
+                numbers = pd.to_numeric(values.where(~blank), errors="coerce")
+                reject(~blank & numbers.isna(), f"{name}: não é um número")
+                chunk[name] = values
+            elif field_type in ("BOOLEAN", "BOOL"):
+                normalized = values.str.lower().map(boolean_values)
+                reject(~blank & normalized.isna(), f"{name}: não é um booleano")
+                chunk[name] = normalized.fillna("")
+            elif field_type in ("DATETIME", "TIMESTAMP", "DATE"):
+                parsed = pd.to_datetime(values.where(~blank), errors="coerce",
+                                        format=self.datetime_format or "ISO8601")
+                retry = ~blank & parsed.isna()
+                if self.datetime_format is None and retry.any():
+                    # Só os valores fora do ISO 8601 passam pelo parser elemento a elemento (mais lento)
+                    parsed[retry] = pd.to_datetime(values[retry], errors="coerce", format="mixed")
+                reject(~blank & parsed.isna(), f"{name}: data/hora inválida")
+                iso_format = "%Y-%m-%d" if field_type == "DATE" else "%Y-%m-%d %H:%M:%S.%f"
+                chunk[name] = parsed.dt.strftime(iso_format).fillna("")
+
+        # Chaves repetidas são rejeitadas entre chunks: o conjunto guarda as chaves das linhas aceitas
+        key_columns = [field["name"] for field in self.schema_json
+                       if field.get("primary_key") and field["name"] in chunk.columns]
+        if key_columns:
+            valid = reasons == ""
+            keys = chunk.loc[valid, key_columns[0]]
+            for name in key_columns[1:]:
+                keys = keys + "\x1f" + chunk.loc[valid, name]
+            duplicated = keys.duplicated() | keys.isin(self._seen_keys)
+            reject(duplicated.reindex(chunk.index, fill_value=False), "chave primária duplicada")
+            self._seen_keys.update(keys[~duplicated])
+
+        rejected = reasons != ""
+        return chunk[~rejected], reasons[rejected].str.rstrip("; ")
+
+    def _write_rejects(self, raw_chunk, reasons):
+        if self.reject_path is None or reasons.empty:
+            return
+        rejects = raw_chunk.loc[reasons.index].copy()
+        # Número da linha de dados no arquivo (1 = primeira linha depois do cabeçalho)
+        rejects.insert(0, "_row", reasons.index + 1)
+        rejects["_reasons"] = reasons
+        rejects.to_csv(self.reject_path, mode="a" if self._reject_columns else "w",
+                       header=self._reject_columns is None, index=False, quoting=csv.QUOTE_MINIMAL)
+        self._reject_columns = list(rejects.columns)
+
+    def _read_chunks(self, csv_path):
+        """
+        Read a CSV file as text in chunks of chunk_size rows with csv.reader.
+
+        Every row is checked against the header width, wherever the chunk boundaries fall: shorter
+        rows are padded with empty fields and longer ones are set aside with the line where they
+        end in the file.
+
+        Yields:
+            Tuples (DataFrame indexed by data row number - 1, list of (row index, line, fields) of the
+            rows with more fields than the header).
+        """
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            width = len(header)
+            rows, index, too_wide = [], [], []
+            row_number = 0
+            for fields in reader:
+                if not fields:
+                    continue  # linhas em branco, ignoradas como no read_csv
+                if len(fields) > width:
+                    too_wide.append((row_number, reader.line_num, fields))
+                else:
+                    rows.append(fields + [""] * (width - len(fields)))
+                    index.append(row_number)
+                row_number += 1
+                if len(rows) + len(too_wide) >= self.chunk_size:
+                    yield pd.DataFrame(rows, columns=header, index=index, dtype=str), too_wide
+                    rows, index, too_wide = [], [], []
+            if rows or too_wide:
+                yield pd.DataFrame(rows, columns=header, index=index, dtype=str), too_wide
+
+    def iter_clean_chunks(self, csv_path):
+        """
+        Read a CSV file in chunks of chunk_size rows and yield only the validated, coerced rows.
+
+        Memory is bounded by one chunk. Lines with more fields than the header are rejected and
+        reported in the reject file with their row and line number.
+
+        Args:
+            csv_path: Path to CSV file.
+
+        Yields:
+            DataFrames with the clean rows of each chunk, as text ready for COPY.
+        """
+        if self.reject_path is not None and os.path.exists(self.reject_path):
+            os.remove(self.reject_path)
+        self._reject_columns = None
+        self._seen_keys = set()
+
+        reason = "número de campos maior que o cabeçalho"
+        for chunk, too_wide in self._read_chunks(csv_path):
+            self.rows_read += len(chunk) + len(too_wide)
+            if too_wide:
+                self.rows_rejected += len(too_wide)
+                self.reasons[reason] += len(too_wide)
+                width = len(chunk.columns)
+                # Os campos que cabem no cabeçalho vão para o arquivo de rejeitados; a razão traz o resto
+                wide_rows = pd.DataFrame([fields[:width] for _, _, fields in too_wide], columns=chunk.columns,
+                                         index=[row for row, _, _ in too_wide], dtype=str)
+                wide_reasons = pd.Series([f"{reason} (linha {line} do arquivo, {len(fields)} campos para "
+                                          f"{width} colunas, excedentes: {fields[width:]})"
+                                          for _, line, fields in too_wide], index=wide_rows.index)
+                self._write_rejects(wide_rows, wide_reasons)
+
+            clean, reasons = self.validate_chunk(chunk.copy())
+            self.rows_rejected += len(reasons)
+            self._write_rejects(chunk, reasons)
+            if len(clean):
+                yield clean
+
+    def summary(self):
+        """Return the counts of the last validation: rows read, rows rejected and rejects per reason."""
+        return {"rows_read": self.rows_read, "rows_rejected": self.rows_rejected, "reasons": dict(self.reasons)}
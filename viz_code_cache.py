@@ -0,0 +1,205 @@
+import ast
+import builtins
+import hashlib
+import os
+
+import utils
+
+# Códigos de visualização já validados, compilados e indexados por hash do código + schema do DataFrame
+compiled_code_cache_size = int(os.getenv("VIZ_COMPILED_CODE_CACHE_SIZE", 256))
+compiled_code_cache = utils.TTLCache(maxsize=compiled_code_cache_size, ttl=None)
+
+# Argumentos do plotly express que recebem nomes de colunas do data_frame
+px_column_arguments = {
+    "x", "y", "z", "color", "symbol", "size", "text", "facet_row", "facet_col", "hover_name",
+    "hover_data", "custom_data", "names", "values", "parents", "ids", "path", "line_group",
+    "pattern_shape", "animation_frame", "animation_group", "error_x", "error_y", "lat", "lon",
+    "locations", "dimensions", "r", "theta", "a", "b", "c",
+}
+# Argumentos em que uma lista é sempre de nomes de colunas; nos demais uma lista literal são os próprios
+# valores (px.bar(df, x=["a", "b"]) desenha "a" e "b"), e não é verificada
+px_column_list_arguments = {"hover_data", "custom_data", "dimensions", "path"}
+# Funções em que df é uma matriz de valores e x/y são rótulos dos eixos, não colunas
+px_matrix_functions = {"imshow"}
+
+
+class VisualizationPrecheckError(Exception):
+    """Raised when generated visualization code fails the static pre-check (syntax, names or columns)."""
+
+
+def schema_signature(df):
+    """Return the column names and dtypes of the DataFrame, the part of it the code depends on."""
+    return tuple((str(column), str(dtype)) for column, dtype in df.dtypes.items())
+
+
+def code_cache_key(python_code, df):
+    """
+    Build the compiled-code cache key for a visualization snippet.
+
+    Args:
+        python_code: Code generated for the visualization.
+        df: DataFrame the code will run against.
+
+    Returns:
+        Tuple with the SHA-256 of the code and the schema signature of the DataFrame.
+    """
+    return hashlib.sha256(python_code.encode("utf-8")).hexdigest(), schema_signature(df)
+
+
+def _defined_names(tree):
+    names = {"df"} | set(dir(builtins))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, ast.MatchAs) and node.name:
+            names.add(node.name)
+    return names
+
+
+def _is_df(node):
+    return isinstance(node, ast.Name) and node.id == "df"
+
+
+def _string_constants(node):
+    # Aceita "col" ou listas/tuplas de nomes de colunas
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [item.value for item in node.elts
+                if isinstance(item, ast.Constant) and isinstance(item.value, str)]
+    return []
+
+
+# Métodos que mudam as colunas do próprio df (sem inplace) ou que o código costuma usar para isso
+df_schema_changing_methods = {"insert", "rename", "assign", "set_axis", "pop", "add_prefix", "add_suffix"}
+
+
+def _df_root(node):
+    # df.columns / df.loc[...] / df.columns.values[0] -> df
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node
+
+
+def _df_schema_changes(tree):
+    """
+    Whether the code rebinds df or may change its columns in place.
+
+    Covers df = ..., assignments to attributes or indexers of df (df.columns = ...,
+    df.loc[:, "col"] = ..., df.at[...] = ...), calls such as df.insert/df.rename/df.assign and any
+    df method called with inplace. Plain df["col"] = ... is not a change: the new column is tracked
+    by _referenced_columns.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == "df" and isinstance(node.ctx, ast.Store):
+            return True
+        if (isinstance(node, (ast.Attribute, ast.Subscript)) and isinstance(node.ctx, (ast.Store, ast.Del))
+                and not (isinstance(node, ast.Subscript) and _is_df(node.value)) and _is_df(_df_root(node))):
+            return True
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and _is_df(node.func.value)
+                and (node.func.attr in df_schema_changing_methods
+                     or any(keyword.arg == "inplace" for keyword in node.keywords))):
+            return True
+    return False
+
+
+def _referenced_columns(tree):
+    created = set()
+    referenced = []
+    for node in ast.walk(tree):
+        # df["col"] / df[["a", "b"]]
+        if isinstance(node, ast.Subscript) and _is_df(node.value):
+            columns = _string_constants(node.slice)
+            if isinstance(node.ctx, ast.Store):
+                created.update(columns)
+            else:
+                referenced.extend((column, node.lineno) for column in columns)
+        # px.bar(df, x="col", ...) / px.bar(data_frame=df, ...)
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+              and isinstance(node.func.value, ast.Name) and node.func.value.id == "px"):
+            uses_df = (node.args and _is_df(node.args[0])) or any(
+                keyword.arg == "data_frame" and _is_df(keyword.value) for keyword in node.keywords)
+            if uses_df and node.func.attr not in px_matrix_functions:
+                for keyword in node.keywords:
+                    if keyword.arg in px_column_list_arguments or (
+                            keyword.arg in px_column_arguments and isinstance(keyword.value, ast.Constant)):
+                        referenced.extend((column, node.lineno) for column in _string_constants(keyword.value))
+    return [(column, lineno) for column, lineno in referenced if column not in created]
+
+
+def precheck_visualization_code(python_code, df):
+    """
+    Statically check generated visualization code before running it.
+
+    Parses the code, checks that every name it reads is defined somewhere in the snippet (or is a
+    builtin / `df`) and that the columns it reads from `df` with df["col"] or plotly express
+    arguments exist. The check is conservative: when the code rebinds `df` or may change its columns
+    (see _df_schema_changes) the column check is skipped.
+
+    Args:
+        python_code: Code generated for the visualization.
+        df: DataFrame the code will run against.
+
+    Returns:
+        The parsed AST, ready to be compiled.
+
+    Raises:
+        VisualizationPrecheckError: If the code has a syntax error, an undefined name or an unknown column.
+    """
+    try:
+        tree = ast.parse(python_code, filename="<visualization>")
+    except SyntaxError as e:
+        raise VisualizationPrecheckError(f"SyntaxError on line {e.lineno}: {e.msg}") from e
+
+    defined = _defined_names(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in defined:
+            raise VisualizationPrecheckError(f"NameError on line {node.lineno}: name '{node.id}' is not defined")
+
+    if not _df_schema_changes(tree):
+        columns = {str(column) for column in df.columns}
+        for column, lineno in _referenced_columns(tree):
+            if column not in columns:
+                raise VisualizationPrecheckError(
+                    f"KeyError on line {lineno}: column '{column}' does not exist in df. "
+                    f"Available columns: {sorted(columns)}")
+    return tree
+
+
+def get_compiled_code(python_code, df, key=None):
+    """
+    Return the compiled code object for a visualization snippet.
+
+    Snippets already validated for the same DataFrame schema come straight from the cache; new ones
+    go through precheck_visualization_code and are compiled from the parsed AST. Call
+    remember_compiled_code once the code has run successfully.
+
+    Args:
+        python_code: Code generated for the visualization.
+        df: DataFrame the code will run against.
+        key: Precomputed code_cache_key, if any.
+
+    Returns:
+        Tuple with the cache key, the code object and whether it came from the cache.
+    """
+    key = key or code_cache_key(python_code, df)
+    code = compiled_code_cache.get(key)
+    if code is not None:
+        return key, code, True
+    tree = precheck_visualization_code(python_code, df)
+    return key, compile(tree, "<visualization>", "exec"), False
+
+
+def remember_compiled_code(key, code):
+    compiled_code_cache.set(key, code)
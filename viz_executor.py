@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+import plotly.io as pio
+import pyarrow as pa
+
+import viz_code_cache
+
+try:
+    import resource
+except ImportError:  # Windows: sem limite de CPU por processo
+    resource = None
+
+# Limites de cada execução de código de visualização, configuráveis por variáveis de ambiente
+viz_workers = int(os.getenv("VIZ_WORKERS", 2))
+viz_cpu_seconds_limit = int(os.getenv("VIZ_CPU_SECONDS_LIMIT", 10))
+viz_wall_seconds_limit = float(os.getenv("VIZ_WALL_SECONDS_LIMIT", 30))
+viz_memory_bytes_limit = int(os.getenv("VIZ_MEMORY_BYTES_LIMIT", 1024 * 1024 * 1024))
+viz_max_tasks_per_worker = int(os.getenv("VIZ_MAX_TASKS_PER_WORKER", 200))
+
+# Módulos importados uma única vez no processo que cria os workers
+preloaded_modules = ["pandas", "numpy", "pyarrow", "plotly.express", "plotly.graph_objects"]
+
+
+class VisualizationSandboxError(Exception):
+    """Raised when generated visualization code is killed for exceeding the sandbox limits."""
+
+
+### Serialização (Arrow IPC em vez de pickle linha a linha)
+
+def encode_dataframe(df):
+    """
+    Serialize a DataFrame as an Arrow IPC stream, falling back to pickle for what Arrow cannot encode
+    (columns it cannot type, duplicated column names such as two `count` columns).
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, ValueError):
+        return ("pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return ("arrow", sink.getvalue().to_pybytes())
+
+
+def decode_dataframe(payload):
+    kind, data = payload
+    if kind == "pickle":
+        return pickle.loads(data)
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+### Worker
+
+def _init_worker():
+    for module in preloaded_modules:
+        __import__(module)
+    # Primeiro gráfico do plotly carrega templates/validadores; paga esse custo ao subir o worker
+    import plotly.express as px
+    pio.to_json(px.bar(pd.DataFrame({"x": ["a"], "y": [1]}), x="x", y="y"))
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _watchdog(stop, deadline, memory_bytes_limit):
+    # Encerra o worker se estourar o tempo total ou a memória residente; o processo principal
+    # recebe BrokenProcessPool e recria o pool
+    while not stop.wait(0.05):
+        if time.monotonic() > deadline:
+            os._exit(70)
+        if memory_bytes_limit and _current_rss_bytes() > memory_bytes_limit:
+            os._exit(71)
+
+
+def _run_visualization_code(python_code, code_key, df_payload, cpu_seconds_limit, wall_seconds_limit,
+                            memory_bytes_limit):
+    if resource is not None and cpu_seconds_limit:
+        # RLIMIT_CPU é cumulativo no processo: o limite vale a partir do uso atual
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used_seconds = int(usage.ru_utime + usage.ru_stime) + 1
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        soft = used_seconds + cpu_seconds_limit
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    stop = threading.Event()
+    watchdog = threading.Thread(target=_watchdog,
+                                args=(stop, time.monotonic() + wall_seconds_limit, memory_bytes_limit),
+                                daemon=True)
+    watchdog.start()
+    try:
+        df = decode_dataframe(df_payload)
+        # O processo principal já fez o pré-check; aqui só reaproveita o código compilado do worker
+        code = viz_code_cache.compiled_code_cache.get(code_key)
+        if code is None:
+            code = compile(python_code, "<visualization>", "exec")
+        exec_globals = {"df": df}
+        exec(code, exec_globals)
+        viz_code_cache.remember_compiled_code(code_key, code)
+        return _encode_outputs(exec_globals)
+    finally:
+        stop.set()
+
+
+def _encode_outputs(exec_globals):
+    outputs = {}
+    fig = exec_globals.get("fig")
+    if fig is not None:
+        outputs["fig"] = pio.to_json(fig)
+    df_viz = exec_globals.get("df_viz")
+    if isinstance(df_viz, pd.Series):
+        df_viz = df_viz.to_frame()
+    if isinstance(df_viz, pd.DataFrame):
+        outputs["df_viz"] = encode_dataframe(df_viz)
+    if exec_globals.get("string_viz_result") is not None:
+        outputs["string_viz_result"] = str(exec_globals["string_viz_result"])
+    return outputs
+
+
+def _noop():
+    return os.getpid()
+
+
+### Pool
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _create_executor(max_workers):
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(preloaded_modules)
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                               max_tasks_per_child=viz_max_tasks_per_worker)
+
+
+def get_executor():
+    """Return the process-wide pool of visualization workers, creating (and warming) it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _create_executor(viz_workers)
+            # Sobe todos os workers agora para a primeira visualização não pagar os imports
+            futures = [_executor.submit(_noop) for _ in range(viz_workers)]
+            # Enquanto isso, aquece a reconstrução das figuras no processo principal
+            pio.from_json(pio.to_json({"data": [{"type": "bar", "x": [0], "y": [0]}]}))
+            for future in futures:
+                future.result()
+        return _executor
+
+
+def _reset_executor(broken_executor):
+    global _executor
+    with _executor_lock:
+        # Várias chamadas recebem o mesmo BrokenProcessPool: só a primeira recria o pool. O pool quebrado
+        # já encerrou os workers que restavam
+        if _executor is broken_executor:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def execute_visualization_code(python_code, df):
+    """
+    Run generated visualization code in a sandboxed worker process.
+
+    The DataFrame is sent as an Arrow IPC stream and only the variables read by the UI come back:
+    fig (rebuilt from its JSON), df_viz and string_viz_result. The worker is killed when the code
+    exceeds viz_cpu_seconds_limit of CPU, viz_wall_seconds_limit of wall time or
+    viz_memory_bytes_limit of resident memory. These limits are enforced inside the worker, so the
+    time spent waiting for a free worker does not count.
+
+    A killed worker breaks the whole pool, failing every task running on it. The pool is recreated
+    and each failed task runs once more in a worker of its own, so only the code that kills that
+    worker again is reported.
+
+    Args:
+        python_code: Code generated for the visualization (uses the `df` variable).
+        df: Result of the SQL query.
+
+    Returns:
+        Dictionary with the fig, df_viz and string_viz_result variables defined by the code.
+
+    Raises:
+        VisualizationPrecheckError: If the code fails the static pre-check (it is not executed).
+        VisualizationSandboxError: If the worker was killed for exceeding a limit.
+        Exception: Any error raised by the code itself.
+    """
+    code_key, code, _ = viz_code_cache.get_compiled_code(python_code, df)
+    task = (_run_visualization_code, python_code, code_key, encode_dataframe(df),
+            viz_cpu_seconds_limit, viz_wall_seconds_limit, viz_memory_bytes_limit)
+    executor = get_executor()
+    try:
+        outputs = executor.submit(*task).result()
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        # O worker morto pode ter sido o de outra visualização que rodava ao mesmo tempo: repete a tarefa
+        # num worker só dela, que nenhuma outra tarefa pode derrubar
+        try:
+            with _create_executor(1) as retry_executor:
+                outputs = retry_executor.submit(*task).result()
+        except BrokenProcessPool:
+            outputs = None
+    if outputs is None:
+        raise VisualizationSandboxError(
+            f"Visualization code was stopped for exceeding the sandbox limits "
+            f"({viz_cpu_seconds_limit}s CPU, {viz_wall_seconds_limit:.0f}s total, "
+            f"{viz_memory_bytes_limit // (1024 * 1024)} MB of memory). Simplify the code or aggregate the data first."
+        )
+
+    viz_code_cache.remember_compiled_code(code_key, code)
+
+    variables = {}
+    if "fig" in outputs:
+        variables["fig"] = pio.from_json(outputs["fig"])
+    if "df_viz" in outputs:
+        variables["df_viz"] = decode_dataframe(outputs["df_viz"])
+    if "string_viz_result" in outputs:
+        variables["string_viz_result"] = outputs["string_viz_result"]
+    return variables
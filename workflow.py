@@ -9,8 +9,12 @@ import prompts
 import settings
 from google.cloud import bigquery
 import bq_functions
+import schema_index
 import utils
+from llm_cache import LLMResponseCache
 import json
+import os
+import time
 import pandas as pd
 
 
@@ -23,6 +27,7 @@ class AgentState(TypedDict):
     result_debug_sql: str
     error_msg_debug_sql: str
     df: pd.DataFrame
+    result_truncated: bool
     visualization_request: str
     python_code_data_visualization: str
     python_code_store_variables_dict: dict
@@ -31,16 +36,42 @@ class AgentState(TypedDict):
     error_msg_debug_python_code_data_visualization: str
 
 
-llm = ChatGroq(model="llama3-70b-8192", temperature=0.3)
+# Response cache shared by every node that calls the LLM (memory + SQLite)
+llm_response_cache = LLMResponseCache()
+llm = ChatGroq(model="llama3-70b-8192", temperature=0.3, cache=llm_response_cache)
 max_characters_error_msg_debug = 300
 
-retriever = VertexAISearchRetriever(
-    project_id=settings.project_id,
-    location_id=settings.vertex_agent_builder_data_store_location,
-    data_store_id=settings.vertex_agent_builder_data_store_id,
-    max_documents=2,
-    engine_data_type=1
-)
+# Caps of the result materialized by the SQL validator (same as the Postgres workflow)
+max_result_rows = 100_000
+max_result_bytes = 256 * 1024 * 1024
+# Results with at least this many rows are downloaded through the Storage Read API instead of REST
+storage_read_min_rows = 20_000
+
+# "execute": runs the query once and classifies planning/execution errors from that single job
+# "plan_first": runs a dry_run job before executing (cost gating, one extra round trip)
+sql_validation_mode = "execute"
+# Moving average of a dry_run round trip, measured on every query in "plan_first" mode. "execute" mode runs
+# no extra dry run; it only adds the last estimate, when there is one, to the time saved
+dry_run_seconds_estimate = None
+# Total time saved without the dry run (accumulated estimate of "execute" mode)
+sql_validation_seconds_saved = 0.0
+
+# "local": BM25 over datasets/tables_descriptions and the schema.json files, persisted to disk
+# "vertex": Vertex AI Search data store (one network round trip per question)
+table_retriever = os.getenv("TABLE_RETRIEVER", "local")
+
+if table_retriever == "vertex":
+    retriever = VertexAISearchRetriever(
+        project_id=settings.project_id,
+        location_id=settings.vertex_agent_builder_data_store_location,
+        data_store_id=settings.vertex_agent_builder_data_store_id,
+        max_documents=2,
+        engine_data_type=1
+    )
+else:
+    retriever = schema_index.LocalTableRetriever(datasets_dir="datasets",
+                                                 index_path=os.getenv("TABLE_INDEX_PATH", ".table_index.json"),
+                                                 max_documents=2)
 
 
 def search_tables_and_schemas(state: AgentState) -> AgentState:
@@ -50,16 +81,12 @@ def search_tables_and_schemas(state: AgentState) -> AgentState:
     # tables_retrieved = retriever.invoke("I want to see the best movies in netflix")
     tables_metadata = [json.loads(doc.page_content) for doc in docs_retrieved]
 
-    schemas = []
-    bq_client = bigquery.Client(project=settings.project_id)
-    for table_metadata in tables_metadata:
-        project_id = table_metadata["project_id"]
-        dataset_id = table_metadata["dataset_id"]
-        table_id = table_metadata["table_id"]
-        schema = bq_functions.get_table_schema(bq_client, project_id, dataset_id, table_id)
-        if schema:
-            schemas.append(schema)
-    
+    tables = [(table_metadata["project_id"], table_metadata["dataset_id"], table_metadata["table_id"])
+              for table_metadata in tables_metadata]
+    # Schemas come from the metadata cache; the ones missing or stale are fetched concurrently
+    schemas = [schema for schema in bq_functions.get_table_schemas(bq_functions.get_client(settings.project_id), tables)
+               if schema]
+
     state["database_schemas"] = "\n---------------\n".join(schemas)
     return state
 
@@ -78,22 +105,54 @@ def agent_sql_writer_node(state: AgentState) -> AgentState:
 
 
 
+def update_dry_run_seconds_estimate(seconds):
+    global dry_run_seconds_estimate
+    if dry_run_seconds_estimate is None:
+        dry_run_seconds_estimate = seconds
+    else:
+        dry_run_seconds_estimate = 0.8 * dry_run_seconds_estimate + 0.2 * seconds
+
+
+def report_dry_run_seconds_saved():
+    global sql_validation_seconds_saved
+    if dry_run_seconds_estimate is None:
+        return
+    sql_validation_seconds_saved += dry_run_seconds_estimate
+    print(f"time saved without the dry run: ~{dry_run_seconds_estimate * 1000:.0f} ms "
+          f"(total ~{sql_validation_seconds_saved:.2f}s)")
+
+
 def agent_sql_validator_node(state: AgentState) -> AgentState:
-    bq_client = bigquery.Client(settings.project_id) 
+    bq_client = bq_functions.get_client(settings.project_id)
     
 
     print("\n\n### Validating query:")
     
     try:
         query = state["query"]
-        # Configure a dry run job
-        job_config = bigquery.QueryJobConfig(dry_run=True)
-        # Start the query as a job (will not execute due to dry_run=True)
-        query_job = bq_client.query(query, job_config=job_config)
-        
-        #after dry_run, try to store the dataframe
-        df = bq_client.query(state["query"]).to_dataframe()
+        if sql_validation_mode == "plan_first":
+            dry_run_start = time.perf_counter()
+            # Configure a dry run job
+            job_config = bigquery.QueryJobConfig(dry_run=True)
+            # Start the query as a job (will not execute due to dry_run=True)
+            query_job = bq_client.query(query, job_config=job_config)
+            update_dry_run_seconds_estimate(time.perf_counter() - dry_run_start)
+            print(f"dry run: {query_job.total_bytes_processed} bytes would be processed")
+
+        # Run the query once: planning and execution errors both surface from this job
+        execution_start = time.perf_counter()
+        df, truncated = bq_functions.fetch_dataframe(bq_client.query(query),
+                                                     max_rows=max_result_rows,
+                                                     max_bytes=max_result_bytes,
+                                                     storage_read_min_rows=storage_read_min_rows,
+                                                     bqstorage_client=bq_functions.get_storage_client())
         state["df"] = df
+        state["result_truncated"] = truncated
+        if truncated:
+            print(f"result truncated to {len(df)} rows")
+        print(f"query executed in {(time.perf_counter() - execution_start) * 1000:.0f} ms")
+        if sql_validation_mode == "execute":
+            report_dry_run_seconds_saved()
 
         state["result_debug_sql"] = "Pass"
         state["error_msg_debug_sql"] = ""
@@ -106,7 +165,7 @@ def agent_sql_validator_node(state: AgentState) -> AgentState:
 
         # return False, f"Error validating query: {str(e)}"
         state["result_debug_sql"] = "Not Pass"
-        state["error_msg_debug_sql"] = str(e)[0:max_characters_error_msg_debug]
+        state["error_msg_debug_sql"] = bq_functions.describe_query_error(e)[0:max_characters_error_msg_debug]
         print(f"result: {state["result_debug_sql"]}")
         print(f'error message: {state["error_msg_debug_sql"]}')
 
@@ -253,6 +312,7 @@ def run_workflow(question: str) -> dict:
         result_debug_sql = "",
         error_msg_debug_sql = "",
         df = pd.DataFrame(),
+        result_truncated = False,
         visualization_request = "",
         python_code_data_visualization = "",
         python_code_store_variables_dict = {},
@@ -261,6 +321,7 @@ def run_workflow(question: str) -> dict:
         error_msg_debug_python_code_data_visualization = ""
     )
     final_state = app.invoke(initial_state)
+    print(f"LLM cache: {llm_response_cache.stats()}")
     return final_state
 
 # state = run_workflow(question = "What are the released years with more released movies and tv shows in netflix. Show me a top 10 by two categories (movie and tv show)")
@@ -2,6 +2,8 @@ from typing import Dict, TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.runnables import RunnableLambda
 # from langchain_google_community import (
 #     VertexAISearchRetriever,
 # )
@@ -9,8 +11,21 @@ import prompts_ps
 # import settings
 # from google.cloud import bigquery
 import ps_functions
+import ps_database
+import schema_index
+import chart_heuristics
+from semantic_cache import SemanticCache, SentenceTransformerEmbedder
 import utils
+import viz_code_cache
+import viz_executor
+from llm_cache import LLMResponseCache
+import asyncio
 import json
+import os
+import pickle
+import re
+import time
+import zlib
 import pandas as pd
 import psycopg2
 from dotenv import load_dotenv
@@ -27,6 +42,8 @@ class AgentState(TypedDict):
     result_debug_sql: str
     error_msg_debug_sql: str
     df: pd.DataFrame
+    result_truncated: bool
+    semantic_cache_hit: bool
     visualization_request: str
     python_code_data_visualization: str
     python_code_store_variables_dict: dict
@@ -35,7 +52,13 @@ class AgentState(TypedDict):
     error_msg_debug_python_code_data_visualization: str
 
 
-llm = ChatGroq(model="llama3-70b-8192", temperature=0.3)
+# Cache compartilhado pelas chamadas ao LLM de todos os nós (memória + SQLite)
+llm_response_cache = LLMResponseCache()
+# Limite opcional de requisições/s ao Groq, para lotes concorrentes não estourarem o rate limit
+groq_requests_per_second = float(os.getenv("GROQ_REQUESTS_PER_SECOND", 0))
+llm = ChatGroq(model="llama3-70b-8192", temperature=0.3, cache=llm_response_cache,
+               rate_limiter=InMemoryRateLimiter(requests_per_second=groq_requests_per_second)
+               if groq_requests_per_second else None)
 max_characters_error_msg_debug = 300
 
 db_config = {
@@ -46,6 +69,174 @@ db_config = {
     'port': 5432
 }
 
+# Poda do schema enviado ao SQL writer (índice BM25 local, sem serviço externo)
+schema_descriptions = schema_index.load_schema_descriptions("datasets")
+schema_pruning_top_k_tables = 3
+schema_pruning_max_tokens = 2000
+
+# Cache semântico pergunta -> SQL validado, consultado antes do SQL writer. Desligado por padrão:
+# com SEMANTIC_CACHE_EMBEDDING_MODEL usa um modelo local do sentence-transformers; sem ele, o embedder
+# por hashing só reaproveita perguntas com as mesmas palavras (ordem, plural e stopwords à parte)
+semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+semantic_cache_embedding_model = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL")
+semantic_cache = SemanticCache(
+    embedder=SentenceTransformerEmbedder(semantic_cache_embedding_model)
+    if semantic_cache_enabled and semantic_cache_embedding_model else None,
+    threshold=0.9)
+
+# Limites do resultado materializado pelo validador de SQL
+max_result_rows = 100_000
+max_result_bytes = 256 * 1024 * 1024
+result_fetch_batch_size = 5_000
+
+# Guard de custo (opcional, desligado por padrão): com PG_GUARD_MAX_TOTAL_COST > 0 toda consulta passa
+# por EXPLAIN (FORMAT JSON) antes de executar, em qualquer sql_validation_mode. "reject" recusa a consulta
+# cara, "limit" tenta reescrevê-la com LIMIT; o erro volta ao fixer em error_msg_debug_sql. Sem o guard,
+# o statement_timeout do pool (PG_STATEMENT_TIMEOUT_MS), que vale sempre, é o limite das consultas caras.
+sql_guard_max_total_cost = float(os.getenv("PG_GUARD_MAX_TOTAL_COST", 0)) or None
+sql_guard_max_plan_rows = max_result_rows
+sql_guard_on_exceed = "limit"
+# Com o guard desligado:
+# "execute": roda a consulta uma única vez e classifica erros de planejamento/execução dessa tentativa
+# "plan_first": roda um EXPLAIN antes de executar (só planejamento, um round trip a mais)
+sql_validation_mode = "execute"
+# Média móvel do tempo de um EXPLAIN, medida sempre que um EXPLAIN roda antes da execução (guard ligado ou
+# "plan_first") ou pelo benchmark (benchmark_workflow_ps.py). No modo "execute" nenhum EXPLAIN extra roda:
+# a estimativa, quando existe, é só somada ao tempo economizado
+explain_seconds_estimate = None
+# Tempo total economizado sem o EXPLAIN prévio (estimativa acumulada do modo "execute")
+sql_validation_seconds_saved = 0.0
+
+# "process_pool": executa o código de visualização em workers isolados e com limites (viz_executor)
+# "in_process": executa com exec() no próprio processo, sem isolamento
+visualization_execution_mode = os.getenv("VISUALIZATION_EXECUTION_MODE", "process_pool")
+
+
+# Catálogo do banco em cache por db_config, revalidado pelo fingerprint do catálogo
+catalog_cache = utils.TTLCache(maxsize=16, ttl=600)
+# Segundos em que o último fingerprint lido é reaproveitado sem consultar o banco
+catalog_fingerprint_max_age = float(os.getenv("PG_CATALOG_FINGERPRINT_MAX_AGE", 30))
+catalog_fingerprint_cache = utils.TTLCache(maxsize=16, ttl=catalog_fingerprint_max_age)
+
+catalog_query = """
+SELECT n.nspname, c.relname, a.attname, format_type(a.atttypid, NULL)
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+WHERE c.relkind IN ('r', 'p')
+  AND c.relpersistence <> 't'
+  AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%'
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+ORDER BY n.nspname, c.relname, a.attnum;
+"""
+
+# CREATE/DROP/TRUNCATE, ADD COLUMN e reescritas de tabela atualizam a linha da relação em pg_class,
+# mudando o xmin dela; basta ler pg_class (sem pg_attribute e sem agregar texto). DDL que só mexe em
+# pg_attribute (renomear uma coluna) aparece quando o TTL do catalog_cache expira.
+# pg_stat_user_tables acumula as linhas modificadas em cada tabela. Tabelas temporárias (como o staging das
+# cargas incrementais) ficam de fora das duas consultas: não são vistas pelas outras sessões.
+catalog_fingerprint_query = """
+SELECT
+    (SELECT count(*) || ':' || coalesce(max(c.xmin::text::bigint), 0)
+     FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     WHERE c.relpersistence <> 't'
+       AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+       AND n.nspname NOT LIKE 'pg_toast%'),
+    (SELECT count(*) || ':' || coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+     FROM pg_catalog.pg_stat_user_tables
+     WHERE schemaname NOT LIKE 'pg_temp%');
+"""
+
+
+def get_catalog_fingerprint(cursor):
+    """
+    Calcula um fingerprint barato do catálogo.
+
+    Args:
+        cursor: Cursor psycopg2 aberto.
+
+    Returns:
+        Dicionário com "ddl" (muda com alterações de estrutura) e "data" (muda com escritas nas tabelas).
+    """
+    cursor.execute(catalog_fingerprint_query)
+    ddl_fingerprint, data_fingerprint = cursor.fetchone()
+    return {"ddl": ddl_fingerprint, "data": data_fingerprint}
+
+
+def get_cached_catalog_fingerprint(db_config):
+    """
+    Fingerprint do catálogo lido no máximo uma vez a cada catalog_fingerprint_max_age segundos por db_config.
+
+    Entre uma leitura e outra nenhuma conexão é usada; alterações feitas nesse intervalo aparecem na
+    leitura seguinte.
+
+    Args:
+        db_config: Dicionário com os parâmetros de conexão ao PostgreSQL.
+
+    Returns:
+        Dicionário com "ddl" e "data" (ver get_catalog_fingerprint).
+    """
+    cache_key = tuple(sorted(db_config.items()))
+    fingerprint = catalog_fingerprint_cache.get(cache_key)
+    if fingerprint is None:
+        with ps_database.connection(db_config) as conn:
+            with conn.cursor() as cursor:
+                fingerprint = get_catalog_fingerprint(cursor)
+        catalog_fingerprint_cache.set(cache_key, fingerprint)
+    return fingerprint
+
+
+def get_postgres_catalog(db_config):
+    """
+    Busca todas as tabelas e colunas do PostgreSQL em uma única consulta ao pg_catalog.
+
+    O resultado fica em cache por db_config e só é recarregado quando o TTL expira
+    ou quando o fingerprint de DDL do catálogo (get_cached_catalog_fingerprint) muda.
+
+    Args:
+        db_config: Dicionário com os parâmetros de conexão ao PostgreSQL.
+
+    Returns:
+        Lista de tuplas (schema, tabela, [(coluna, tipo), ...]).
+    """
+    cache_key = tuple(sorted(db_config.items()))
+    fingerprint = get_cached_catalog_fingerprint(db_config)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None and cached[0] == fingerprint["ddl"]:
+        return cached[1]
+
+    with ps_database.connection(db_config) as conn:
+        cursor = conn.cursor()
+        cursor.execute(catalog_query)
+        catalog = []
+        for schema, table, column, data_type in cursor.fetchall():
+            if not catalog or catalog[-1][:2] != (schema, table):
+                catalog.append((schema, table, []))
+            catalog[-1][2].append((column, data_type))
+
+    catalog_cache.set(cache_key, (fingerprint["ddl"], catalog))
+    return catalog
+
+
+def format_schemas_and_tables(catalog):
+    """
+    Formata o catálogo no texto usado pelo prompt do SQL writer.
+
+    Args:
+        catalog: Lista de tuplas (schema, tabela, [(coluna, tipo), ...]).
+
+    Returns:
+        Uma linha por tabela no formato "schema.tabela: coluna (tipo), ...".
+    """
+    schemas_and_tables = []
+    for schema, table, columns in catalog:
+        column_details = ", ".join([f"{column} ({data_type})" for column, data_type in columns])
+        schemas_and_tables.append(f"{schema}.{table}: {column_details}")
+    return "\n".join(schemas_and_tables)
+
 
 def get_postgres_schemas_and_tables(db_config):
     """
@@ -58,47 +249,25 @@ def get_postgres_schemas_and_tables(db_config):
         Uma string formatada com os esquemas e tabelas disponíveis.
     """
     try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-
-        # Consulta para obter esquemas e tabelas
-        query = """
-        SELECT table_schema, table_name
-        FROM information_schema.tables
-        WHERE table_type = 'BASE TABLE' AND table_schema NOT IN ('pg_catalog', 'information_schema');
-        """
-        cursor.execute(query)
-        tables = cursor.fetchall()
-
-        # Formatar os resultados
-        schemas_and_tables = []
-        for schema, table in tables:
-            query_columns = f"""
-            SELECT column_name, data_type
-            FROM information_schema.columns
-            WHERE table_schema = '{schema}' AND table_name = '{table}';
-            """
-            cursor.execute(query_columns)
-            columns = cursor.fetchall()
-            column_details = ", ".join([f"{col[0]} ({col[1]})" for col in columns])            
-            schemas_and_tables.append(f"{schema}.{table}: {column_details}")
-
-
-        return "\n".join(schemas_and_tables)
-
+        return format_schemas_and_tables(get_postgres_catalog(db_config))
     except Exception as e:
         print(f"Erro ao buscar esquemas e tabelas: {e}")
         return ""
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 
 def search_tables_and_schemas(state: AgentState) -> AgentState:
     print("Buscando tabelas, esquemas e colunas no PostgreSQL...")
-    schemas_and_tables = get_postgres_schemas_and_tables(db_config)
+    try:
+        catalog = get_postgres_catalog(db_config)
+        # Mantém no prompt apenas as tabelas/colunas mais relevantes para a pergunta
+        catalog = schema_index.prune_catalog(state["question"], catalog, schema_descriptions,
+                                             top_k_tables=schema_pruning_top_k_tables,
+                                             max_tokens=schema_pruning_max_tokens)
+        schemas_and_tables = format_schemas_and_tables(catalog)
+    except Exception as e:
+        print(f"Erro ao buscar esquemas e tabelas: {e}")
+        schemas_and_tables = ""
+
     if schemas_and_tables:
         print("Esquemas, tabelas e colunas encontrados:")
         print(schemas_and_tables)
@@ -110,19 +279,143 @@ def search_tables_and_schemas(state: AgentState) -> AgentState:
     return state
 
 
-def agent_sql_writer_node(state: AgentState) -> AgentState:
+def semantic_cache_context():
+    # O SQL guardado só vale para o mesmo catálogo (fingerprint de DDL); o schema podado varia por pergunta
+    try:
+        return get_cached_catalog_fingerprint(db_config)["ddl"]
+    except Exception as e:
+        print(f"Erro ao ler o fingerprint do catálogo, cache semântico ignorado: {e}")
+        return None
+
 
+def lookup_semantic_cache(state: AgentState):
+    if not semantic_cache_enabled:
+        return None
+    context = semantic_cache_context()
+    if context is None:
+        return None
+    cached_query = semantic_cache.lookup(state["question"], context=context)
+    print(f"Cache semântico: {semantic_cache.stats()}")
+    return cached_query
+
+
+### Preparação e tratamento das respostas dos nós do LLM, compartilhados pelos nós sync e async
+# (os nós só diferem em chain.invoke x chain.ainvoke)
+
+def use_cached_sql_query(state: AgentState) -> bool:
+    # Reaproveita o SQL já validado de uma pergunta equivalente, sem chamar o LLM
+    cached_query = lookup_semantic_cache(state)
+    if cached_query is None:
+        return False
+    state["query"] = cached_query
+    state["semantic_cache_hit"] = True
+    print(f"### Agent SQL Writer query (cache):\n {state["query"]}")
+    return True
+
+
+def prepare_sql_writer(state: AgentState):
     prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_sql_writer))
 
     chain = prompt_template | llm
 
-    response = chain.invoke({"question": state["question"], 
-                             "database_schemas": state["database_schemas"]}).content
+    return chain, {"question": state["question"],
+                   "database_schemas": state["database_schemas"]}
+
+
+def apply_sql_writer_response(state: AgentState, response: str, seconds: float) -> AgentState:
+    semantic_cache.record_writer_latency(seconds)
     state["query"] = utils.extract_code_block(content=response,language="sql")
     print(f"### Agent SQL Writer query:\n {state["query"]}")
     return state
 
 
+def prepare_bi_expert(state: AgentState):
+    prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_bi_expert_node))
+
+    chain = prompt_template | llm
+
+    return chain, {"question": state["question"],
+                   "query": state["query"],
+                   "df_structure": state["df"].dtypes,
+                   "df_sample": state["df"].head(5)
+                   }
+
+
+def apply_bi_expert_response(state: AgentState, response: str) -> AgentState:
+    state["visualization_request"] = response
+    print(f"\n### Visualization Request:\n {state["visualization_request"]}")
+
+    return state
+
+
+def prepare_python_code_data_visualization_generator(state: AgentState):
+    prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_python_code_data_visualization_generator_node))
+
+    chain = prompt_template | llm
+
+    return chain, {"visualization_request": state["visualization_request"],
+                   "df_structure": state["df"].dtypes,
+                   "df_sample": state["df"].head(5)
+                   }
+
+
+def apply_python_code_data_visualization_generator_response(state: AgentState, response: str) -> AgentState:
+    state["python_code_data_visualization"] = utils.extract_code_block(content=response,language="python")
+
+    print(f"\n### Data visualization code:\n {state["python_code_data_visualization"]}")
+
+    return state
+
+
+def prepare_bi_expert_and_visualization_generator(state: AgentState):
+    # Fast path: escolha da visualização e geração do código em uma única chamada ao LLM
+    prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_bi_expert_and_visualization_generator_node))
+
+    chain = prompt_template | llm
+
+    return chain, {"question": state["question"],
+                   "query": state["query"],
+                   "df_structure": state["df"].dtypes,
+                   "df_sample": state["df"].head(5)
+                   }
+
+
+def parse_bi_expert_and_visualization_response(state: AgentState, response: str) -> AgentState:
+    state["python_code_data_visualization"] = utils.extract_code_block(content=response,language="python")
+    state["visualization_request"] = re.sub(r"```.*?```", "", response, flags=re.DOTALL).strip()
+
+    print(f"\n### Visualization Request:\n {state["visualization_request"]}")
+    print(f"\n### Data visualization code:\n {state["python_code_data_visualization"]}")
+
+    return state
+
+
+def agent_sql_writer_node(state: AgentState) -> AgentState:
+    if use_cached_sql_query(state):
+        return state
+    chain, inputs = prepare_sql_writer(state)
+    writer_start = time.perf_counter()
+    response = chain.invoke(inputs).content
+    return apply_sql_writer_response(state, response, time.perf_counter() - writer_start)
+
+
+
+def update_explain_seconds_estimate(seconds):
+    global explain_seconds_estimate
+    if explain_seconds_estimate is None:
+        explain_seconds_estimate = seconds
+    else:
+        explain_seconds_estimate = 0.8 * explain_seconds_estimate + 0.2 * seconds
+
+
+def report_explain_seconds_saved():
+    global sql_validation_seconds_saved
+    if explain_seconds_estimate is None:
+        return
+    sql_validation_seconds_saved += explain_seconds_estimate
+    print(f"Tempo economizado sem o EXPLAIN prévio: ~{explain_seconds_estimate * 1000:.0f} ms "
+          f"(total ~{sql_validation_seconds_saved:.2f}s).")
+
 
 def agent_sql_validator_node(state: AgentState) -> AgentState:
     print("\n\n### Validating query:")
@@ -131,21 +424,42 @@ def agent_sql_validator_node(state: AgentState) -> AgentState:
         query = state["query"]
         print(f"Query gerada: {query}")
 
-        # Conectar ao PostgreSQL
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-
-        # Executar a consulta em modo dry-run (simulação)
-        cursor.execute(f"EXPLAIN {query}")
-        print("Consulta validada com sucesso.")
-
-        # Executar a consulta e armazenar os resultados
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        state["df"] = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+        # Usar uma conexão do pool compartilhado; ela volta ao pool antes de qualquer chamada ao LLM
+        with ps_database.connection(db_config) as conn:
+            explain_first = bool(sql_guard_max_total_cost) or sql_validation_mode == "plan_first"
+            if explain_first:
+                explain_start = time.perf_counter()
+                if sql_guard_max_total_cost:
+                    query = ps_database.guard_query(conn, query,
+                                                    max_total_cost=sql_guard_max_total_cost,
+                                                    max_plan_rows=sql_guard_max_plan_rows,
+                                                    on_exceed=sql_guard_on_exceed)
+                else:
+                    ps_database.explain_query(conn, query)
+                update_explain_seconds_estimate(time.perf_counter() - explain_start)
+                state["query"] = query
+                print("Consulta validada com sucesso.")
+
+            # Executar a consulta e armazenar os resultados, com limite de linhas e bytes
+            execution_start = time.perf_counter()
+            state["df"], state["result_truncated"] = ps_database.fetch_dataframe(
+                conn, query,
+                max_rows=max_result_rows,
+                max_bytes=max_result_bytes,
+                batch_size=result_fetch_batch_size
+            )
+            print(f"Consulta executada em {(time.perf_counter() - execution_start) * 1000:.0f} ms.")
+            if not explain_first:
+                report_explain_seconds_saved()
+            if state["result_truncated"]:
+                print(f"Resultado truncado em {len(state['df'])} linhas.")
 
         state["result_debug_sql"] = "Pass"
         state["error_msg_debug_sql"] = ""
+        if semantic_cache_enabled:
+            context = semantic_cache_context()
+            if context is not None:
+                semantic_cache.add(state["question"], state["query"], context=context)
         print(f"Resultado: {state['result_debug_sql']}")
 
         return state
@@ -153,7 +467,7 @@ def agent_sql_validator_node(state: AgentState) -> AgentState:
     except Exception as e:
         state["num_retries_debug_sql"] += 1
         state["result_debug_sql"] = "Not Pass"
-        state["error_msg_debug_sql"] = str(e)[:max_characters_error_msg_debug]
+        state["error_msg_debug_sql"] = ps_database.describe_query_error(e)[:max_characters_error_msg_debug]
         print(f"Resultado: {state['result_debug_sql']}")
         print(f"Mensagem de erro: {state['error_msg_debug_sql']}")
 
@@ -173,47 +487,48 @@ def agent_sql_validator_node(state: AgentState) -> AgentState:
 
         return state
 
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
-
-
-
-def agent_bi_expert_node(state: AgentState) -> AgentState:
-    
-    prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_bi_expert_node))
 
-    chain = prompt_template | llm
 
-    response = chain.invoke({"question": state["question"],
-                             "query": state["query"],
-                             "df_structure": state["df"].dtypes,
-                             "df_sample": state["df"].head(5)
-                             }).content
+def heuristic_visualization_node(state: AgentState) -> AgentState:
+    # Resultados com formato trivial (valor único, categoria x número, data x número) dispensam o LLM
+    if state["result_debug_sql"] != "Pass":
+        # Consulta que esgotou as tentativas: o df vazio não significa "sem dados", segue para o LLM
+        return state
+    python_code = chart_heuristics.select_visualization_code(state["df"], state["question"])
+    if python_code is not None:
+        state["visualization_request"] = "Heuristic visualization (no LLM)"
+        state["python_code_data_visualization"] = python_code
+        print(f"\n### Data visualization code (heuristic):\n {state["python_code_data_visualization"]}")
+    return state
 
-    state["visualization_request"] = response
-    print(f"\n### Visualization Request:\n {state["visualization_request"]}")
 
-    return state
+def agent_bi_expert_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_bi_expert(state)
+    return apply_bi_expert_response(state, chain.invoke(inputs).content)
 
 
 def agent_python_code_data_visualization_generator_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_python_code_data_visualization_generator(state)
+    return apply_python_code_data_visualization_generator_response(state, chain.invoke(inputs).content)
 
-    prompt_template = ChatPromptTemplate(("system", prompts_ps.system_prompt_agent_python_code_data_visualization_generator_node))
 
-    chain = prompt_template | llm
+def agent_bi_expert_and_visualization_generator_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_bi_expert_and_visualization_generator(state)
+    return parse_bi_expert_and_visualization_response(state, chain.invoke(inputs).content)
 
-    response = chain.invoke({"visualization_request": state["visualization_request"],
-                             "df_structure": state["df"].dtypes,
-                             "df_sample": state["df"].head(5)
-                             }).content
-    state["python_code_data_visualization"] = utils.extract_code_block(content=response,language="python")
 
-    print(f"\n### Data visualization code:\n {state["python_code_data_visualization"]}")
+def execute_visualization_code(python_code_data_visualization: str, df: pd.DataFrame) -> dict:
+    if visualization_execution_mode == "process_pool":
+        return viz_executor.execute_visualization_code(python_code_data_visualization, df)
 
-    return state
+    # Código já validado para o mesmo schema vem compilado do cache; código novo passa pelo pré-check
+    code_key, code, _ = viz_code_cache.get_compiled_code(python_code_data_visualization, df)
+
+    # Create a dictionary to store the executed variables for the python code generated
+    exec_globals = {"df": df}
+    exec(code, exec_globals)
+    viz_code_cache.remember_compiled_code(code_key, code)
+    return exec_globals
 
 
 def agent_python_code_data_visualization_validator_node(state: AgentState) -> AgentState:    
@@ -221,11 +536,8 @@ def agent_python_code_data_visualization_validator_node(state: AgentState) -> Ag
     print("\n\n### Validating data visualization code:")
     
     try:
-        df = state["df"]
-        # Create a dictionary to store the executed variables for the python code generated
-        exec_globals = {"df": df}
-        exec(state["python_code_data_visualization"], exec_globals)
-        state["python_code_store_variables_dict"] = exec_globals
+        state["python_code_store_variables_dict"] = execute_visualization_code(
+            state["python_code_data_visualization"], state["df"])
         state["result_debug_python_code_data_visualization"] = "Pass"
         state["error_msg_debug_python_code_data_visualization"] = ""
         print(f"result: {state["result_debug_python_code_data_visualization"]}")
@@ -258,47 +570,192 @@ def agent_python_code_data_visualization_validator_node(state: AgentState) -> Ag
         return state
 
 
-workflow = StateGraph(state_schema=AgentState)
+### Async nodes: chamadas ao LLM com ainvoke e acesso ao banco/exec em threads
+
+async def asearch_tables_and_schemas(state: AgentState) -> AgentState:
+    return await asyncio.to_thread(search_tables_and_schemas, state)
+
+
+async def aagent_sql_writer_node(state: AgentState) -> AgentState:
+    if use_cached_sql_query(state):
+        return state
+    chain, inputs = prepare_sql_writer(state)
+    writer_start = time.perf_counter()
+    response = (await chain.ainvoke(inputs)).content
+    return apply_sql_writer_response(state, response, time.perf_counter() - writer_start)
+
+
+async def aagent_sql_validator_node(state: AgentState) -> AgentState:
+    return await asyncio.to_thread(agent_sql_validator_node, state)
+
+
+async def aagent_bi_expert_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_bi_expert(state)
+    return apply_bi_expert_response(state, (await chain.ainvoke(inputs)).content)
+
+
+async def aagent_python_code_data_visualization_generator_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_python_code_data_visualization_generator(state)
+    return apply_python_code_data_visualization_generator_response(state, (await chain.ainvoke(inputs)).content)
+
+
+async def aagent_bi_expert_and_visualization_generator_node(state: AgentState) -> AgentState:
+    chain, inputs = prepare_bi_expert_and_visualization_generator(state)
+    return parse_bi_expert_and_visualization_response(state, (await chain.ainvoke(inputs)).content)
+
+
+async def aagent_python_code_data_visualization_validator_node(state: AgentState) -> AgentState:
+    return await asyncio.to_thread(agent_python_code_data_visualization_validator_node, state)
+
+
+def node(func, afunc):
+    # O mesmo nó roda com app.invoke (func) e com app.ainvoke (afunc)
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
+
+def build_workflow(fast_path: bool = False, heuristic_visualization: bool = True):
+    """
+    Monta e compila o grafo.
+
+    Args:
+        fast_path: Se True, o BI expert e o gerador de visualização viram um único nó com um prompt
+            combinado, economizando uma chamada ao LLM entre o resultado do SQL e o gráfico.
+        heuristic_visualization: Se True, resultados com formato trivial recebem a visualização por
+            regras (chart_heuristics) e vão direto ao validador, sem chamadas ao LLM.
+    """
+    workflow = StateGraph(state_schema=AgentState)
+
+    # Nó do LLM que recebe o resultado do SQL validado
+    visualization_entry_node = ("agent_bi_expert_and_visualization_generator_node" if fast_path
+                                else "agent_bi_expert_node")
+    # Nó que recebe o resultado do SQL validado
+    sql_result_node = "heuristic_visualization_node" if heuristic_visualization else visualization_entry_node
+
+    workflow.add_node("search_tables_and_schemas",node(search_tables_and_schemas, asearch_tables_and_schemas))
+    workflow.add_node("agent_sql_writer_node",node(agent_sql_writer_node, aagent_sql_writer_node))
+    workflow.add_node("agent_sql_validator_node",node(agent_sql_validator_node, aagent_sql_validator_node))
+    if heuristic_visualization:
+        workflow.add_node("heuristic_visualization_node",node(heuristic_visualization_node, None))
+    if fast_path:
+        workflow.add_node("agent_bi_expert_and_visualization_generator_node",node(agent_bi_expert_and_visualization_generator_node, aagent_bi_expert_and_visualization_generator_node))
+    else:
+        workflow.add_node("agent_bi_expert_node",node(agent_bi_expert_node, aagent_bi_expert_node))
+        workflow.add_node("agent_python_code_data_visualization_generator_node",node(agent_python_code_data_visualization_generator_node, aagent_python_code_data_visualization_generator_node))
+    workflow.add_node("agent_python_code_data_visualization_validator_node",node(agent_python_code_data_visualization_validator_node, aagent_python_code_data_visualization_validator_node))
+
+
+    workflow.add_edge("search_tables_and_schemas","agent_sql_writer_node")
+    workflow.add_edge("agent_sql_writer_node","agent_sql_validator_node")
+
+    workflow.add_conditional_edges(
+        'agent_sql_validator_node',
+        lambda state: sql_result_node
+        if state['result_debug_sql']=="Pass" or state['num_retries_debug_sql'] >= state['max_num_retries_debug'] 
+        else 'agent_sql_validator_node',
+        {sql_result_node: sql_result_node,'agent_sql_validator_node': 'agent_sql_validator_node'}
+    )
+    if heuristic_visualization:
+        workflow.add_conditional_edges(
+            'heuristic_visualization_node',
+            lambda state: 'agent_python_code_data_visualization_validator_node'
+            if state['python_code_data_visualization']
+            else visualization_entry_node,
+            {'agent_python_code_data_visualization_validator_node': 'agent_python_code_data_visualization_validator_node',
+             visualization_entry_node: visualization_entry_node}
+        )
+    if fast_path:
+        workflow.add_edge("agent_bi_expert_and_visualization_generator_node","agent_python_code_data_visualization_validator_node")
+    else:
+        workflow.add_edge("agent_bi_expert_node","agent_python_code_data_visualization_generator_node")
+        workflow.add_edge("agent_python_code_data_visualization_generator_node","agent_python_code_data_visualization_validator_node")
+
+    workflow.add_conditional_edges(
+        'agent_python_code_data_visualization_validator_node',
+        lambda state: "end" 
+        if state['result_debug_python_code_data_visualization']=="Pass" or state['num_retries_debug_python_code_data_visualization'] >= state['max_num_retries_debug'] 
+        else 'agent_python_code_data_visualization_validator_node',
+        {'end': END,'agent_python_code_data_visualization_validator_node': 'agent_python_code_data_visualization_validator_node'}
+    )
+
+
+    workflow.set_entry_point("search_tables_and_schemas")
+
+    return workflow.compile()
 
 
-workflow.add_node("search_tables_and_schemas",search_tables_and_schemas)
-workflow.add_node("agent_sql_writer_node",agent_sql_writer_node)
-workflow.add_node("agent_sql_validator_node",agent_sql_validator_node)
-workflow.add_node("agent_bi_expert_node",agent_bi_expert_node)
-workflow.add_node("agent_python_code_data_visualization_generator_node",agent_python_code_data_visualization_generator_node)
-workflow.add_node("agent_python_code_data_visualization_validator_node",agent_python_code_data_visualization_validator_node)
+app = build_workflow()
+app_fast_path = build_workflow(fast_path=True)
 
+### Result cache
 
-workflow.add_edge("search_tables_and_schemas","agent_sql_writer_node")
-workflow.add_edge("agent_sql_writer_node","agent_sql_validator_node")
+# Resultados completos por pergunta normalizada + fingerprint do banco (estrutura e escritas)
+result_cache = utils.TTLCache(maxsize=256, ttl=3600)
 
-workflow.add_conditional_edges(
-    'agent_sql_validator_node',
-    lambda state: 'agent_bi_expert_node' 
-    if state['result_debug_sql']=="Pass" or state['num_retries_debug_sql'] >= state['max_num_retries_debug'] 
-    else 'agent_sql_validator_node',
-    {'agent_bi_expert_node': 'agent_bi_expert_node','agent_sql_validator_node': 'agent_sql_validator_node'}
-)
-workflow.add_edge("agent_bi_expert_node","agent_python_code_data_visualization_generator_node")
-workflow.add_edge("agent_python_code_data_visualization_generator_node","agent_python_code_data_visualization_validator_node")
 
-workflow.add_conditional_edges(
-    'agent_python_code_data_visualization_validator_node',
-    lambda state: "end" 
-    if state['result_debug_python_code_data_visualization']=="Pass" or state['num_retries_debug_python_code_data_visualization'] >= state['max_num_retries_debug'] 
-    else 'agent_python_code_data_visualization_validator_node',
-    {'end': END,'agent_python_code_data_visualization_validator_node': 'agent_python_code_data_visualization_validator_node'}
-)
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!.").strip().lower()
 
 
-workflow.set_entry_point("search_tables_and_schemas")
+def get_result_cache_key(question: str):
+    """
+    Chave do cache de resultados. Como o fingerprint muda com DDL e com escritas registradas em
+    pg_stat_user_tables, entradas de tabelas alteradas deixam de ser encontradas e expiram pelo LRU/TTL.
+    O fingerprint é o mesmo reaproveitado pelo cache do catálogo (get_cached_catalog_fingerprint), então
+    um acerto não usa conexão; escritas aparecem em até catalog_fingerprint_max_age segundos.
+    Retorna None se o fingerprint não puder ser lido (o cache é ignorado).
+    """
+    try:
+        fingerprint = get_cached_catalog_fingerprint(db_config)
+    except Exception as e:
+        print(f"Erro ao ler o fingerprint do banco, cache de resultados ignorado: {e}")
+        return None
+    return (normalize_question(question), fingerprint["ddl"], fingerprint["data"])
+
+
+def store_cached_result(cache_key, state: AgentState):
+    if cache_key is None:
+        return
+    if state["result_debug_sql"] != "Pass" or state["result_debug_python_code_data_visualization"] != "Pass":
+        return
+    result_cache.set(cache_key, {
+        "database_schemas": state["database_schemas"],
+        "query": state["query"],
+        # DataFrame serializado e comprimido para manter o cache compacto
+        "df": zlib.compress(pickle.dumps(state["df"], protocol=pickle.HIGHEST_PROTOCOL)),
+        "result_truncated": state["result_truncated"],
+        "visualization_request": state["visualization_request"],
+        "python_code_data_visualization": state["python_code_data_visualization"],
+    })
+
+
+def load_cached_result(question: str, cache_key):
+    if cache_key is None:
+        return None
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+
+    state = build_initial_state(question)
+    state.update({key: value for key, value in cached.items() if key != "df"})
+    state["df"] = pickle.loads(zlib.decompress(cached["df"]))
+    state["result_debug_sql"] = "Pass"
+    # Reexecuta o código de visualização já validado para recriar o fig/df_viz/string_viz_result
+    try:
+        state["python_code_store_variables_dict"] = execute_visualization_code(
+            state["python_code_data_visualization"], state["df"])
+    except Exception as e:
+        print(f"Erro ao reexecutar a visualização do cache: {e}")
+        result_cache.pop(cache_key)
+        return None
+    state["result_debug_python_code_data_visualization"] = "Pass"
+    print("### Resultado obtido do cache.")
+    return state
 
-app = workflow.compile()
 
 ### Run workflow
 
-def run_workflow(question: str) -> dict:
-    initial_state = AgentState(
+def build_initial_state(question: str) -> AgentState:
+    return AgentState(
         question = question,
         database_schemas = "",
         query = "",
@@ -307,6 +764,8 @@ def run_workflow(question: str) -> dict:
         result_debug_sql = "",
         error_msg_debug_sql = "",
         df = pd.DataFrame(),
+        result_truncated = False,
+        semantic_cache_hit = False,
         visualization_request = "",
         python_code_data_visualization = "",
         python_code_store_variables_dict = {},
@@ -314,9 +773,102 @@ def run_workflow(question: str) -> dict:
         result_debug_python_code_data_visualization = "",
         error_msg_debug_python_code_data_visualization = ""
     )
-    final_state = app.invoke(initial_state)
+
+
+def run_workflow(question: str, fast_path: bool = False) -> dict:
+    """
+    Responde uma pergunta: SQL validado, resultado e visualização.
+
+    Toda consulta é limitada pelo statement_timeout do pool (PG_STATEMENT_TIMEOUT_MS). Com o guard de
+    custo ligado (PG_GUARD_MAX_TOTAL_COST > 0), o SQL também passa por EXPLAIN antes de executar,
+    qualquer que seja o sql_validation_mode, e consultas caras são recusadas ou reescritas com LIMIT
+    (sql_guard_on_exceed).
+
+    Args:
+        question: Pergunta do usuário.
+        fast_path: Usa o grafo com o prompt combinado de BI expert + visualização.
+
+    Returns:
+        Estado final do grafo.
+    """
+    cache_key = get_result_cache_key(question)
+    cached_state = load_cached_result(question, cache_key)
+    if cached_state is not None:
+        return cached_state
+
+    initial_state = build_initial_state(question)
+    final_state = (app_fast_path if fast_path else app).invoke(initial_state)
+    store_cached_result(cache_key, final_state)
+    print(f"Cache do LLM: {llm_response_cache.stats()}")
+    return final_state
+
+
+def stream_workflow(question: str, fast_path: bool = False):
+    """
+    Roda o grafo nó a nó, para a interface mostrar o SQL assim que ele é validado e o gráfico em seguida.
+
+    Args:
+        question: Pergunta do usuário.
+        fast_path: Usa o grafo com o prompt combinado de BI expert + visualização.
+
+    Yields:
+        Tuplas (nome do nó, estado acumulado até esse nó). Um resultado do cache de resultados vem
+        como uma única tupla ("result_cache", estado final).
+    """
+    cache_key = get_result_cache_key(question)
+    cached_state = load_cached_result(question, cache_key)
+    if cached_state is not None:
+        yield "result_cache", cached_state
+        return
+
+    state = build_initial_state(question)
+    for update in (app_fast_path if fast_path else app).stream(state, stream_mode="updates"):
+        for node_name, node_state in update.items():
+            state.update(node_state)
+            yield node_name, state
+    store_cached_result(cache_key, state)
+
+
+async def arun_workflow(question: str, fast_path: bool = False) -> dict:
+    cache_key = await asyncio.to_thread(get_result_cache_key, question)
+    cached_state = await asyncio.to_thread(load_cached_result, question, cache_key)
+    if cached_state is not None:
+        return cached_state
+
+    initial_state = build_initial_state(question)
+    final_state = await (app_fast_path if fast_path else app).ainvoke(initial_state)
+    store_cached_result(cache_key, final_state)
     return final_state
 
+
+async def arun_workflow_batch(questions: list[str], concurrency: int = 8, fast_path: bool = False) -> list:
+    """
+    Roda várias perguntas ao mesmo tempo no mesmo grafo compilado.
+
+    Args:
+        questions: Lista de perguntas.
+        concurrency: Quantidade máxima de perguntas em andamento ao mesmo tempo.
+        fast_path: Usa o grafo com o prompt combinado de BI expert + visualização.
+
+    Returns:
+        Lista com o estado final de cada pergunta (ou a exceção levantada), na ordem das perguntas.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_question(question):
+        async with semaphore:
+            return await arun_workflow(question, fast_path=fast_path)
+
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(run_question(question) for question in questions), return_exceptions=True)
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(questions)} perguntas em {elapsed:.1f}s ({len(questions) / elapsed:.2f} perguntas/s).")
+    return results
+
+
+def run_workflow_batch(questions: list[str], concurrency: int = 8, fast_path: bool = False) -> list:
+    return asyncio.run(arun_workflow_batch(questions, concurrency=concurrency, fast_path=fast_path))
+
 # state = run_workflow(question = "Quantidade de filmes lançados em 2020 na netflix?")
 # print(state)
 # state = run_workflow(question = "How many movies were released in 2020 in netflix?") 